@@ -1,14 +1,29 @@
+import copy
+import fnmatch
+import heapq
 import json
 import os
+import re
+import shlex
+import shutil
 import socket
 import sys
+import time
 import xml.etree.cElementTree as et
-from subprocess import Popen, PIPE, run
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from subprocess import Popen, run, TimeoutExpired
 
 import networkx as nx
 from junitparser import JUnitXml
 
-from jcov_parser import JcovParser
+from build_file import BuildFileEditor
+from call_graph import CallGraphCache, get_call_graph_edges, iter_dirs_classes, iter_jar_classes
+from jcov_parser import JcovParser, merge_jcov_results
+from method_index import MethodIndexCache, get_patch_methods
+from reachability import ReachabilityEngine
+from test_details_store import TestDetailsStore
+from test_file_index import TestFileIndex
+from tracer_state import TracerState
 
 et.register_namespace('', "http://maven.apache.org/POM/4.0.0")
 et.register_namespace('xsi', "http://www.w3.org/2001/XMLSchema-instance")
@@ -59,15 +74,50 @@ class TestResult(object):
     def as_dict(self):
         return {'_test_name': self.full_name, '_outcome': self.outcome}
 
+    def to_cache(self):
+        return {'classname': self.classname, 'name': self.name, 'time': self.time, 'outcome': self.outcome}
+
+    @staticmethod
+    def from_cache(cached, report_file=None):
+        test = TestResult.__new__(TestResult)
+        test.junit_test = None
+        test.classname = cached['classname']
+        test.name = cached['name']
+        test.time = cached['time']
+        test.full_name = "{classname}.{name}".format(classname=test.classname, name=test.name)
+        test.report_file = report_file
+        test.outcome = cached['outcome']
+        return test
+
+
+def parse_junit_report(report):
+    # the cached form of the test cases of a junit xml report, empty when it is not a valid report
+    try:
+        xml = JUnitXml.fromfile(report)
+        # newer junitparser versions wrap a single testsuite root in a JUnitXml
+        suites = xml if isinstance(xml, JUnitXml) else [xml]
+        return [TestResult(case, suite.name, report).to_cache() for suite in suites for case in suite]
+    except Exception as e:
+        print(e, report)
+        return []
+
 
 class Tracer:
     JCOV_JAR_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "externals", "jcov.jar")
     CALL_GRAPH_JAR_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "externals",
                                        "javacg-0.1-SNAPSHOT-static.jar")
     TRACER_INFO = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "tracer_info")
-
-    def __init__(self, repo_path, trace_type, ind=0):
+    CALL_GRAPH_CACHE = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "call_graph_cache")
+    METHOD_INDEX_CACHE = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                                      "method_index_cache")
+    JUNIT_REPORT_PATTERN = 'TEST-*.xml'
+    # test methods that run for every test of their class
+    LIFECYCLE_METHODS = ['setUp', 'tearDown', 'setUpClass', 'tearDownClass', 'setUpBeforeClass', 'tearDownAfterClass',
+                         'suite', '<clinit>']
+
+    def __init__(self, repo_path, trace_type, ind=0, test_selection='class'):
         self.trace_type = trace_type
+        self.test_selection = test_selection
         self.command_port = 5552
         self.agent_port = 5551
         self.repo_path = repo_path
@@ -77,19 +127,28 @@ class Tracer:
         self.tracer_info = Tracer.TRACER_INFO + '_' + str(ind)
         if not os.path.exists(self.tracer_info):
             os.mkdir(self.tracer_info)
+        self.state = TracerState(self.tracer_info)
         self.path_to_result_file = os.path.join(self.tracer_info, f"result_{self.trace_type}.xml")
         self.path_to_out_template = os.path.join(self.tracer_info, f"template_{self.trace_type}.xml")
         self.path_to_classes_file = os.path.join(self.tracer_info, f"classes_{self.trace_type}")
         self.path_to_tests_details = os.path.join(self.tracer_info, f"test_details_{self.trace_type}.json")
+        self.path_to_tests_details_binary = os.path.join(self.tracer_info, f"test_details_{self.trace_type}.bin")
         self.path_to_tests_results = os.path.join(self.tracer_info, f"test_results_{self.trace_type}.json")
+        self.path_to_reports_cache = os.path.join(self.tracer_info, 'junit_reports_cache.json')
         self.bugs_file = os.path.join(self.tracer_info, 'bugs.json')
         self.bugs_all_comps = os.path.join(self.tracer_info, 'bugs_all_comps.json')
         self.call_graph_path = os.path.join(self.tracer_info, 'call_graph.gexf')
         self.call_graph_tests_path = os.path.join(self.tracer_info, 'call_graph_tests.json')
         self.call_graph_nodes_path = os.path.join(self.tracer_info, 'call_graph_nodes.json')
+        self.call_graph_test_methods_path = os.path.join(self.tracer_info, 'call_graph_test_methods.json')
+        self.test_selection_report_path = os.path.join(self.tracer_info, 'test_selection_report.json')
         self.tests_to_exclude_path = os.path.join(self.tracer_info, 'tests_to_exclude.json')
         self.trigger_tests_path = os.path.join(self.tracer_info, 'trigger_tests.json')
         self.tests_run_log = os.path.join(self.tracer_info, 'tests_run_log')
+        self.path_to_grabber_ports = os.path.join(self.tracer_info, f"grabber_ports_{self.trace_type}.json")
+        if os.path.exists(self.path_to_grabber_ports):
+            with open(self.path_to_grabber_ports) as f:
+                self.agent_port, self.command_port = json.loads(f.read())
 
         if self.trace_type == 'sanity':
             self.matrix = os.path.join(self.tracer_info, f"matrix_{self.trace_type}.json")
@@ -97,33 +156,58 @@ class Tracer:
             self.matrix = os.path.join(self.tracer_info, f"matrix_{ind}_{self.trace_type}.json")
         self.test_results = {}
         self.tests_to_run = None
+        self.test_methods_to_run = None
         self.tests_to_exclude = None
         self.classes_to_trace = None
         self.set_by_trace_type()
 
     def set_by_trace_type(self):
-        if os.path.exists(self.tests_to_exclude_path):
-            with open(self.tests_to_exclude_path) as f:
-                exclude = json.loads(f.read())
+        exclude = self.state.get_list('tests_to_exclude', self.tests_to_exclude_path)
+        if exclude is not None:
             self.tests_to_exclude = list(set(map(lambda t: f"**/{t.split('.')[-2]}.java", exclude)))
-        bugs = []
-        if not os.path.exists(self.bugs_file):
+        bugs = self.state.get_list('bugs', self.bugs_file)
+        if bugs is None:
             return
-        if not os.path.exists(self.call_graph_tests_path):
+        relevant_tests = self.state.get_list('call_graph_tests', self.call_graph_tests_path)
+        if relevant_tests is None:
             return
-        with open(self.bugs_file) as f:
-            bugs = list(set(map(lambda x: '.'.join(x.split('.')[:-1]), json.loads(f.read()))))
+        bugs = list(set(map(Tracer.get_bug_class, bugs)))
         tests_classes = list(set(map(lambda x: '.'.join(x.split('.')[:-1]), self.get_trigger_tests())))
-        with open(self.call_graph_tests_path) as f:
-            relevant_tests = json.loads(f.read())
-        with open(self.call_graph_nodes_path) as f:
-            relevant_nodes = json.loads(f.read())
+        relevant_nodes = self.state.get_list('call_graph_nodes', self.call_graph_nodes_path)
         if self.trace_type == 'sanity':
             self.classes_to_trace = bugs + tests_classes
             self.tests_to_run = list(set(map(lambda t: f"**/{t.split('.')[-1]}.java", tests_classes)))
         elif self.trace_type == 'full':
             self.classes_to_trace = list(set(relevant_nodes))
             self.tests_to_run = list(set(map(lambda t: f"**/{t.split('.')[-1]}.java", relevant_tests)))
+            test_methods = None
+            if self.test_selection == 'method':
+                test_methods = self.state.get_list('call_graph_test_methods', self.call_graph_test_methods_path)
+            if test_methods is not None:
+                excluded = set(map(TestFileIndex.get_key, self.tests_to_exclude or []))
+                self.test_methods_to_run = dict(filter(lambda item: item[0].split('.')[-1].lower() not in excluded,
+                                                       Tracer.group_test_methods(test_methods).items()))
+                self.tests_to_run = list(set(map(lambda t: f"**/{t.split('.')[-1]}.java", self.test_methods_to_run)))
+
+    @staticmethod
+    def split_test_name(test_name):
+        # the class and the method of a test name. ant selects test methods by their plain name only, so the method
+        # of a parameterized (testFoo[0]) or junit5 (testFoo()) test is None, and its class runs entirely
+        name = re.split(r'[\[(]', test_name, 1)[0]
+        test_class, method_name = name.rsplit('.', 1)
+        return test_class, method_name if name == test_name else None
+
+    @staticmethod
+    def group_test_methods(test_methods):
+        # the methods to run of every test class, None for the classes that run entirely (stored as class.*)
+        tests = {}
+        for test_method in test_methods:
+            class_name, method_name = test_method.rsplit('.', 1)
+            if method_name == '*':
+                tests[class_name] = None
+            elif tests.get(class_name, []) is not None:
+                tests.setdefault(class_name, []).append(method_name)
+        return tests
 
     def set_junit_formatter(self):
         self.set_junit_formatter_file(self.xml_path)
@@ -149,90 +233,47 @@ class Tracer:
     #     with open(self.tests_run_log, 'w') as f:
     #         f.writelines(lines)
 
-    def exclude_tests(self):
+    def exclude_tests(self, dry_run=False):
+        # returns the test files that were removed, or would be removed in a dry run
         if not self.tests_to_exclude:
             print("not tests to exclude")
-            return
-        element_tree = et.parse(self.xml_path)
-        junit = list(filter(lambda x: x.tag == 'junit', element_tree.iter()))
-        if junit:
-            for junit_element in junit:
-                batchtest = list(filter(lambda x: x.tag == 'batchtest', junit_element.iter()))
-                for b in batchtest:
-                    fileset = list(filter(lambda x: x.tag == 'fileset', b.iter()))[0]
-                    for t in self.tests_to_exclude:
-                        exclude = et.SubElement(fileset, 'exclude')
-                        exclude.attrib.update({'name': t})
-        element_tree.write(self.xml_path, xml_declaration=True)
-        tests = list(set(map(lambda x: x.replace('.java', '').replace('**/', '').lower(), self.tests_to_exclude)))
-        print(f"tests to remove {tests}")
-        for root, _, files in os.walk(os.path.dirname(self.xml_path)):
-            for f in filter(lambda x: (x.endswith('.java') or x.endswith('.class')) and 'test' in x.lower(), files):
-                for t in tests:
-                    if t in f.lower():
-                        try:
-                            if os.path.exists(os.path.join(root, f)):
-                                print("remove test file " + os.path.join(root, f))
-                                os.remove(os.path.join(root, f))
-                        except Exception as e:
-                            print(e)
+            return []
+        if not dry_run:
+            with BuildFileEditor(self.xml_path) as editor:
+                editor.add_excludes(self.tests_to_exclude)
+        paths = TestFileIndex(os.path.dirname(self.xml_path)).get_paths(self.tests_to_exclude)
+        print(f"tests to remove {sorted(set(map(TestFileIndex.get_key, self.tests_to_exclude)))}")
+        for path in paths:
+            if dry_run:
+                print("would remove test file " + path)
+                continue
+            try:
+                print("remove test file " + path)
+                os.remove(path)
+            except Exception as e:
+                print(e)
+        return paths
 
     def set_junit_formatter_file(self, xml_path):
-        element_tree = et.parse(xml_path)
-        junit = list(filter(lambda x: x.tag == 'junit', element_tree.iter()))
-        if junit:
-            for j in junit:
-                j.attrib.update({'fork': 'true', 'forkmode': 'once', 'haltonerror': 'false', 'haltonfailure': 'false'})
-                formatter = list(filter(lambda x: x.tag == 'formatter', j.iter()))
-                if formatter:
-                    formatter = formatter[0]
-                else:
-                    formatter = et.SubElement(j, 'formatter')
-                formatter.attrib.update({'type': 'xml', 'usefile': 'true'})
-
-                jvmarg = list(filter(lambda x: x.tag == 'jvmarg', j.iter()))
-                if jvmarg:
-                    jvmarg = jvmarg[0]
-                else:
-                    jvmarg = et.SubElement(j, 'jvmarg')
-                arg_line = r'-javaagent:{JCOV_JAR_PATH}=grabber,port={PORT},include_list={CLASSES_FILE},template={OUT_TEMPLATE},type=method'.format(
-                    JCOV_JAR_PATH=Tracer.JCOV_JAR_PATH, PORT=self.agent_port, CLASSES_FILE=self.path_to_classes_file,
-                    OUT_TEMPLATE=self.path_to_out_template)
-                jvmarg.attrib.update({'value': arg_line})
-                if self.tests_to_run or self.tests_to_exclude:
-                    self.set_junit_tests(j)
-        element_tree.write(xml_path, xml_declaration=True)
+        arg_line = r'-javaagent:{JCOV_JAR_PATH}=grabber,port={PORT},include_list={CLASSES_FILE},template={OUT_TEMPLATE},type=method'.format(
+            JCOV_JAR_PATH=Tracer.JCOV_JAR_PATH, PORT=self.agent_port, CLASSES_FILE=self.path_to_classes_file,
+            OUT_TEMPLATE=self.path_to_out_template)
+        with BuildFileEditor(xml_path) as editor:
+            editor.set_junit_attributes()
+            editor.set_formatter()
+            editor.set_jvmarg(arg_line)
+            if self.tests_to_run or self.tests_to_exclude:
+                self.set_junit_tests(editor)
+            editor.set_test_methods(self.test_methods_to_run)
 
     def set_junit_properties(self, xml_path):
-        element_tree = et.parse(xml_path)
-        junit = list(filter(lambda x: x.tag == 'junit', element_tree.iter()))
-        if junit:
-            for j in junit:
-                j.attrib.update({'fork': 'true', 'forkmode': 'once', 'haltonerror': 'false', 'haltonfailure': 'false'})
-                formatter = list(filter(lambda x: x.tag == 'formatter', j.iter()))
-                if formatter:
-                    formatter = formatter[0]
-                else:
-                    formatter = et.SubElement(j, 'formatter')
-                formatter.attrib.update({'type': 'xml', 'usefile': 'true'})
-        element_tree.write(xml_path, xml_declaration=True)
-
-    def set_junit_tests(self, junit_element):
-        batchtest = list(filter(lambda x: x.tag == 'batchtest', junit_element.iter()))
-        for b in batchtest:
-            fileset = list(filter(lambda x: x.tag == 'fileset', b.iter()))[0]
-            includes = list(filter(lambda x: x.tag == 'include', fileset.iter()))
-            excludes = list(filter(lambda x: x.tag == 'exclude', fileset.iter()))
-            for i in includes:
-                fileset.remove(i)
-            if self.tests_to_run:
-                for t in self.tests_to_run:
-                    include = et.SubElement(fileset, 'include')
-                    include.attrib.update({'name': t})
-            if self.tests_to_exclude:
-                for t in self.tests_to_exclude:
-                    exclude = et.SubElement(fileset, 'exclude')
-                    exclude.attrib.update({'name': t})
+        with BuildFileEditor(xml_path) as editor:
+            editor.set_junit_attributes()
+            editor.set_formatter()
+
+    def set_junit_tests(self, editor):
+        editor.set_includes(self.tests_to_run)
+        editor.add_excludes(self.tests_to_exclude)
 
     def get_classes_path(self):
         all_classes = {os.path.dirname(self.xml_path)}
@@ -257,16 +298,29 @@ class Tracer:
                     '-command_port', self.command_port, '-t', self.path_to_out_template, '-o', self.path_to_result_file]
         return list(map(str, cmd_line))
 
-    def check_if_grabber_is_on(self):
-        import time
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            time.sleep(5)
-            s.connect(('127.0.0.1', int(self.command_port)))
-            s.close()
-            return True
-        except:
-            return False
+    def allocate_ports(self):
+        # free ports for this tracer, saved so the Tracer objects of the next stages (and the CLI) use them too
+        sockets = []
+        for _ in range(2):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.bind(('127.0.0.1', 0))
+            sockets.append(s)
+        self.agent_port, self.command_port = list(map(lambda s: s.getsockname()[1], sockets))
+        list(map(lambda s: s.close(), sockets))
+        with open(self.path_to_grabber_ports, 'w') as f:
+            json.dump([self.agent_port, self.command_port], f)
+
+    def check_if_grabber_is_on(self, timeout=60, process=None):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if process is not None and process.poll() is not None:
+                return False
+            try:
+                with socket.create_connection(('127.0.0.1', int(self.command_port)), timeout=1):
+                    return True
+            except OSError:
+                time.sleep(0.2)
+        return False
 
     def execute_template_process(self):
         run(self.template_creator_cmd_line())
@@ -275,21 +329,93 @@ class Tracer:
                 with open(path) as f:
                     assert f.read(), "{0} is empty".format(path)
 
-    def execute_grabber_process(self):
+    def execute_grabber_process(self, timeout=60):
+        # the grabber is killed when it does not accept commands in time, as no session owns it yet to stop it
         p = Popen(self.grabber_cmd_line())
-        assert p.poll() is None
-        assert self.check_if_grabber_is_on()
+        if not self.check_if_grabber_is_on(timeout, p):
+            exit_code = p.poll()
+            if exit_code is None:
+                p.kill()
+                exit_code = p.wait()
+            raise RuntimeError("the grabber on port {0} did not start, exit code {1}".format(self.command_port,
+                                                                                             exit_code))
+        return p
+
+    def grabber_session(self, timeout=60):
+        return GrabberSession(self, timeout)
+
+    def forked_grabber_session(self, forks, timeout=60):
+        return ForkedGrabberSession(self, forks, timeout)
+
+    def get_tests_times(self):
+        # the historical run time of every test class by its simple name, from the last recorded tests run
+        times = {}
+        for test_name, _, test_time in self.state.get_test_results():
+            class_name = test_name.rsplit('.', 1)[0].split('.')[-1].lower()
+            times[class_name] = times.get(class_name, 0) + (test_time or 0)
+        return times
+
+    def split_tests(self, forks):
+        # splits the test classes to run into balanced groups by their historical times, longest first to the least
+        # loaded group. the tests of the last run are used when there is no selection
+        tests = self.tests_to_run
+        if not tests:
+            tests = list(set(map(lambda t: f"**/{t[0].rsplit('.', 1)[0].split('.')[-1]}.java",
+                                 self.state.get_test_results())))
+        if not tests:
+            return [None]
+        times = self.get_tests_times()
+        default_time = (sum(times.values()) / len(times)) if times else 1
+        tests_times = list(map(lambda t: (times.get(TestFileIndex.get_key(t), default_time), t), tests))
+        groups = list(map(lambda ind: (0, ind, []), range(min(forks, len(tests)))))
+        heapq.heapify(groups)
+        for test_time, test in sorted(tests_times, reverse=True):
+            load, ind, group = heapq.heappop(groups)
+            group.append(test)
+            heapq.heappush(groups, (load + test_time, ind, group))
+        return list(map(lambda g: g[2], sorted(groups, key=lambda g: g[1])))
+
+    def get_fork(self, ind, tests):
+        # a tracer of one fork: its own build file copy (next to the original, so relative paths still resolve),
+        # ports, result file and junit reports directory, sharing the template of this tracer. the forks run in the
+        # same working tree, so their build files run the tests without compiling, on the classes compiled before
+        fork = copy.copy(self)
+        fork.xml_path = os.path.join(os.path.dirname(self.xml_path), f"fork_{ind}_{os.path.basename(self.xml_path)}")
+        shutil.copyfile(self.xml_path, fork.xml_path)
+        reports_dir = os.path.join(self.tracer_info, f"reports_{self.trace_type}_fork_{ind}")
+        os.makedirs(reports_dir, exist_ok=True)
+        with BuildFileEditor(fork.xml_path) as editor:
+            editor.skip_compilation()
+            editor.set_reports_dir(reports_dir)
+        fork.path_to_result_file = os.path.join(self.tracer_info, f"result_{self.trace_type}_fork_{ind}.xml")
+        fork.path_to_grabber_ports = os.path.join(self.tracer_info, f"grabber_ports_{self.trace_type}_fork_{ind}.json")
+        fork.tests_to_run = tests
+        if self.test_methods_to_run and tests:
+            keys = set(map(TestFileIndex.get_key, tests))
+            fork.test_methods_to_run = dict(filter(lambda item: item[0].split('.')[-1].lower() in keys,
+                                                   self.test_methods_to_run.items()))
+        return fork
+
+    def save_and_stop_grabber(self):
+        Popen(["java", "-jar", Tracer.JCOV_JAR_PATH, "grabberManager", "-save", '-command_port',
+               str(self.command_port)]).communicate()
+        self.stop_grabber_process()
 
-    def stop_grabber(self):
+    def stop_grabber_process(self):
+        Popen(["java", "-jar", Tracer.JCOV_JAR_PATH, "grabberManager", "-stop", '-command_port',
+               str(self.command_port)]).communicate()
+
+    def stop_grabber(self, binary_details=False):
+        self.save_and_stop_grabber()
+        self.process_result_file(binary_details)
+
+    def process_result_file(self, binary_details=False):
         def make_nice_trace(t):
             return list(
                 map(lambda x: x.lower().replace("java.lang.", "").replace("java.io.", "").replace("java.util.", ""), t))
 
-        Popen(["java", "-jar", Tracer.JCOV_JAR_PATH, "grabberManager", "-save", '-command_port',
-               str(self.command_port)]).communicate()
-        Popen(["java", "-jar", Tracer.JCOV_JAR_PATH, "grabberManager", "-stop", '-command_port',
-               str(self.command_port)]).communicate()
-        traces = list(JcovParser(None, [self.path_to_result_file], True, True).parse(False))[0].split_to_subtraces()
+        traces = list(JcovParser(None, [self.path_to_result_file], True, True, streaming=True,
+                                 template_path=self.path_to_out_template).parse_columnar(False))[0].split_to_subtraces()
         trigger_tests = list(map(lambda x: x.lower(), self.get_trigger_tests()))
         relevant_traces = traces
         tests_details = []
@@ -309,123 +435,213 @@ class Tracer:
         bugs = []
         if not components:
             return
-        with open(self.bugs_file) as f:
-            bugs_all_comps = list(set(map(lambda x: x.lower(), set(json.loads(f.read())))) & all_components)
-            bugs = list(set(bugs_all_comps) & components)
+        bugs_all_comps = list(set(map(lambda x: x.lower(), set(self.state.get_list('bugs', self.bugs_file)))) & all_components)
+        bugs = list(set(bugs_all_comps) & components)
         with open(self.path_to_tests_details, "w") as f:
             json.dump(optimized_tests, f)
         with open(self.path_to_tests_details + '2', "w") as f:
             json.dump(tests_details, f)
-        with open(self.bugs_all_comps, "w") as f:
-            json.dump(bugs, f)
+        self.state.set_list('bugs_all_comps', bugs, self.bugs_all_comps)
+        if binary_details:
+            TestDetailsStore.write(self.path_to_tests_details_binary, optimized_tests)
+            TestDetailsStore.write(self.path_to_tests_details_binary + '2', tests_details)
         if bugs:
             write_json_planning_file(self.matrix, optimized_tests, bugs)
 
     def get_xml_files(self):
-        for root, _, files in os.walk(os.path.dirname(self.xml_path)):
-            for name in files:
-                if name.endswith('.xml'):
-                    yield os.path.join(root, name)
+        # the junit formatter reports only, not every xml of the project
+        for root, dirs, files in os.walk(os.path.dirname(self.xml_path)):
+            dirs[:] = list(filter(lambda d: d != '.git', dirs))
+            for name in fnmatch.filter(files, Tracer.JUNIT_REPORT_PATTERN):
+                yield os.path.join(root, name)
 
-    def observe_tests(self):
-        self.test_results = {}
+    def load_reports_cache(self):
+        if not os.path.exists(self.path_to_reports_cache):
+            return {}
+        try:
+            with open(self.path_to_reports_cache) as f:
+                return json.loads(f.read())
+        except Exception as e:
+            print(e)
+            return {}
+
+    def collect_reports(self, workers=None):
+        # the test cases of every report. reports with the same mtime and size as in the last run are taken from the
+        # cache, the others are parsed in a pool
+        cache = self.load_reports_cache()
+        reports = {}
+        changed = []
         for report in self.get_xml_files():
-            try:
-                suite = JUnitXml.fromfile(report)
-                for case in suite:
-                    test = TestResult(case, suite.name, report)
-                    self.test_results[test.full_name.lower()] = test
-            except Exception as e:
-                print(e, report)
-                pass
+            stat = os.stat(report)
+            key = [stat.st_mtime_ns, stat.st_size]
+            cached = cache.get(report)
+            if cached and cached['key'] == key:
+                reports[report] = cached
+            else:
+                reports[report] = {'key': key, 'cases': None}
+                changed.append(report)
+        if len(changed) > 1 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = list(executor.map(parse_junit_report, changed, chunksize=max(1, len(changed) // 64)))
+        else:
+            parsed = list(map(parse_junit_report, changed))
+        for report, cases in zip(changed, parsed):
+            reports[report]['cases'] = cases
+        if changed or len(reports) != len(cache):
+            with open(self.path_to_reports_cache + '.tmp', 'w') as f:
+                json.dump(reports, f)
+            os.replace(self.path_to_reports_cache + '.tmp', self.path_to_reports_cache)
+        return reports
+
+    def observe_tests(self, workers=None):
+        self.test_results = {}
+        for report, cached in self.collect_reports(workers).items():
+            for case in cached['cases']:
+                test = TestResult.from_cache(case, report)
+                self.test_results[test.full_name.lower()] = test
         with open(self.path_to_tests_results, "w") as f:
             json.dump(list(map(lambda x: x.as_dict(), self.test_results.values())), f)
+        self.state.add_test_results(self.trace_type, self.test_results.values())
         tests = list(set(map(lambda x: x.full_name, filter(lambda t: not t.is_passed() and not t.is_skipped(), self.test_results.values()))))
-        with open(self.trigger_tests_path, 'w') as f:
-            json.dump(tests, f)
-        if not os.path.exists(self.tests_to_exclude_path):
-            with open(self.tests_to_exclude_path, 'w') as f:
-                json.dump(tests, f)
+        self.state.set_list('trigger_tests', tests, self.trigger_tests_path)
+        if not self.state.has_list('tests_to_exclude', self.tests_to_exclude_path):
+            self.state.set_list('tests_to_exclude', tests, self.tests_to_exclude_path)
         return self.test_results
 
     def get_trigger_tests(self):
-        with open(self.trigger_tests_path) as f:
-            exclude = json.loads(f.read())
-            return exclude
-
-    def get_buggy_functions(self):
-        bugs = list(set(map(lambda x: x.method_name_parameters.replace(',', ';'),
-                            diff.get_modified_exists_functions(os.path.dirname(self.xml_path)))))
+        return self.state.get_list('trigger_tests', self.trigger_tests_path)
+
+    def get_buggy_functions(self, src_patch=None):
+        # the methods that contain the hunks of the source patch, or the modified methods javadiff finds in the repo
+        # when there is no patch or none of its hunks is in a method. note that the names in bugs.json differ by
+        # source: the patch methods are named as jcov names them (org.A$B.foo(int), org.A$B.A$B() for constructors
+        # and org.A.A_init() for static initializers), javadiff names them by its own method_name_parameters.
+        # get_bug_class and get_bug_method read both
+        bugs = []
+        if src_patch and os.path.exists(src_patch):
+            bugs = get_patch_methods(self.repo_path, src_patch, MethodIndexCache(Tracer.METHOD_INDEX_CACHE))
+        if not bugs:
+            bugs = list(set(map(lambda x: x.method_name_parameters.replace(',', ';'),
+                                diff.get_modified_exists_functions(os.path.dirname(self.xml_path)))))
         if bugs:
-            with open(self.bugs_file, "w") as f:
-                json.dump(bugs, f)
-
-    def create_call_graph(self, jar_path):
-        cmd = ["java", "-jar", Tracer.CALL_GRAPH_JAR_PATH, jar_path]
-        edges = set()
-        edges = edges.union(set(
-            str(Popen(cmd, stdout=PIPE).communicate()[0]).replace('(M)', '').replace('(I)', '').replace('(D)',
-                                                                                                        '').replace(
-                '(S)', '').replace('(O)', '').replace('\\r', '').split('\\n')))
-        classes_edges = set()
-        for v, u in list(filter(lambda x: x, map(lambda x: x[2:].split(), edges))):
-            if ':' in v:
-                v = v.split(':')[0]
-            if ':' in u:
-                u = u.split(':')[0]
-            if '$' in v:
-                v = v.split('$')[0]
-            if '$' in u:
-                u = u.split('$')[0]
-            if v.startswith('['):
-                v = v[2:]
-            if u.startswith('['):
-                u = u[2:]
-            if '[' in v:
-                v = v.split('[')[0]
-            if '[' in u:
-                u = u.split('[')[0]
-            for prefix in ['java.', 'org.junit', 'javax.']:
-                if u.startswith(prefix) or v.startswith(prefix):
-                    u = ''
-                    v = ''
-            if v != u and v and u:
-                classes_edges.add((v, u))
+            self.state.set_list('bugs', bugs, self.bugs_file)
+
+    @staticmethod
+    def get_bug_class(bug):
+        # the top level class of a buggy method, as in the call graph: org.A$B.foo(int) is org.A
+        return '.'.join(bug.split('(')[0].split('.')[:-1]).split('$')[0]
+
+    @staticmethod
+    def get_bug_method(bug):
+        # the source level name of a buggy method, as in the methods call graph: org.A$B.foo(int) is org.A.B.foo and
+        # the constructor org.A$B.A$B(int) is org.A.B.B. the static initializer org.A$B.A$B_init() is org.A.B.<clinit>, as
+        # javacg names it
+        class_name, _, method_name = bug.split('(')[0].rpartition('.')
+        if method_name == class_name.split('.')[-1] + '_init':
+            method_name = '<clinit>'
+        return class_name.replace('$', '.') + '.' + method_name.split('$')[-1]
+
+    def create_call_graph(self, jar_path=None, class_roots=None):
+        # analyses the given jar, otherwise only the class files under the class roots (the compiled classes of the
+        # project by default), without archiving the repository
+        if jar_path:
+            class_files = iter_jar_classes(jar_path)
+        else:
+            class_files = iter_dirs_classes(class_roots or self.get_classes_path())
+        edges = get_call_graph_edges(Tracer.CALL_GRAPH_JAR_PATH, class_files, CallGraphCache(Tracer.CALL_GRAPH_CACHE))
         g_forward = nx.DiGraph()
-        g_forward.add_edges_from(classes_edges)
+        g_forward.add_edges_from(edges['classes'])
         nx.write_gexf(g_forward, self.call_graph_path)
-        bugs_classes = []
-        with open(self.bugs_file) as f:
-            bugs_classes = list(set(map(lambda x: '.'.join(x.split('.')[:-1]), json.loads(f.read()))))
+        bugs_classes = list(set(map(Tracer.get_bug_class, self.state.get_list('bugs', self.bugs_file))))
         trigger_tests_classes = list(set(map(lambda x: '.'.join(x.split('.')[:-1]), self.get_trigger_tests())))
         tests_classes = list(filter(
             lambda x: x.split('.')[-1].startswith('Test') or x.split('.')[-1].endswith('Test') or x.split('.')[
                 -1].endswith('TestCase'), g_forward.nodes))
-        relevant_tests = set()
-        for t in tests_classes:
-            for b in bugs_classes:
-                if t not in g_forward or b not in g_forward:
-                    continue
-                if nx.has_path(g_forward, t, b):
-                    relevant_tests.add(t)
-                    break
+        engine = ReachabilityEngine(g_forward)
+        relevant_tests = engine.get_relevant_tests(tests_classes, bugs_classes)
         if not set(trigger_tests_classes).intersection(relevant_tests):
             return
-        g2 = nx.DiGraph(g_forward)
-        nx.write_gexf(g2, self.call_graph_path + '2')
-        relevant_nodes = set(relevant_tests)
-        relevant_nodes.update(set(bugs_classes))
-        for t in relevant_tests:
-            if t not in g2:
+        nx.write_gexf(g_forward, self.call_graph_path + '2')
+        relevant_nodes = engine.get_relevant_nodes(relevant_tests, bugs_classes)
+        self.state.set_list('call_graph_tests', relevant_tests, self.call_graph_tests_path)
+        self.state.set_list('call_graph_nodes', relevant_nodes, self.call_graph_nodes_path)
+        methods_graph = nx.DiGraph()
+        methods_graph.add_edges_from(edges['methods'])
+        self.select_test_methods(methods_graph, relevant_tests)
+
+    def select_test_methods(self, methods_graph, relevant_tests):
+        # the test methods of the relevant test classes that reach a buggy method in the methods call graph, and the
+        # trigger tests. a class runs entirely when the bug is reached from its lifecycle methods, constructors or inner
+        # classes, or only from methods that are not named as tests
+        bugs_methods = set(map(Tracer.get_bug_method, self.state.get_list('bugs', self.bugs_file)))
+        reaching = ReachabilityEngine(methods_graph).reaching(bugs_methods)
+        selected = dict(map(lambda test_class: (test_class, set()), relevant_tests))
+        whole_classes = set()
+        for method in reaching:
+            test_class = next(filter(lambda c: c in selected, map(lambda ind: method.rsplit('.', ind)[0],
+                                                                   range(1, method.count('.') + 1))), None)
+            if test_class is None:
                 continue
-            paths = nx.single_source_shortest_path(g2, t)
-            reachable = set(paths.keys())
-            relevant_nodes.update(reachable)
-            g2.remove_nodes_from(reachable)
-        with open(self.call_graph_tests_path, "w") as f:
-            json.dump(list(relevant_tests), f)
-        with open(self.call_graph_nodes_path, "w") as f:
-            json.dump(list(relevant_nodes), f)
+            method_name = method[len(test_class) + 1:]
+            if '.' in method_name or method_name in Tracer.LIFECYCLE_METHODS or method_name == test_class.split('.')[
+                    -1] or method_name.lower().startswith('before') or method_name.lower().startswith('after'):
+                whole_classes.add(test_class)
+            elif method_name.startswith('test'):
+                selected[test_class].add(method_name)
+        trigger_tests = self.get_trigger_tests()
+        trigger_tests_names = list(map(Tracer.split_test_name, trigger_tests))
+        reached_trigger_tests = list(map(lambda item: item[0], filter(
+            lambda item: item[1][0] in whole_classes or item[1][1] in selected.get(item[1][0], set()),
+            zip(trigger_tests, trigger_tests_names))))
+        for trigger_test, (test_class, method_name) in zip(trigger_tests, trigger_tests_names):
+            selected.setdefault(test_class, set())
+            if method_name is None:
+                print(f"the trigger test {trigger_test} can not be selected by its method, running all of {test_class}")
+                whole_classes.add(test_class)
+            else:
+                selected[test_class].add(method_name)
+        test_methods = []
+        for test_class, methods in selected.items():
+            if test_class in whole_classes or not methods:
+                test_methods.append(test_class + '.*')
+            else:
+                test_methods.extend(map(lambda m: test_class + '.' + m, sorted(methods)))
+        self.state.set_list('call_graph_test_methods', test_methods, self.call_graph_test_methods_path)
+        self.write_test_selection_report(methods_graph, relevant_tests, test_methods, trigger_tests,
+                                         reached_trigger_tests)
+        return test_methods
+
+    def write_test_selection_report(self, methods_graph, relevant_tests, test_methods, trigger_tests,
+                                    reached_trigger_tests):
+        # compares the method level selection to the class level one, by the number of test methods and by the time
+        # the selected tests took in the last recorded tests run
+        tests_methods = {}
+        for method in filter(lambda m: m.rsplit('.', 1)[0] in relevant_tests, methods_graph.nodes):
+            if method.rsplit('.', 1)[-1].startswith('test'):
+                tests_methods.setdefault(method.rsplit('.', 1)[0], set()).add(method.rsplit('.', 1)[-1])
+        tests = Tracer.group_test_methods(test_methods)
+        times = dict(map(lambda result: (result[0], result[2] or 0), self.state.get_test_results() or []))
+
+        def get_time(is_selected):
+            return sum(map(lambda item: item[1], filter(lambda item: is_selected(*item[0].rsplit('.', 1)),
+                                                        filter(lambda item: '.' in item[0], times.items()))))
+
+        class_level = {'test_classes': len(relevant_tests),
+                       'test_methods': sum(map(len, tests_methods.values())),
+                       'time': get_time(lambda c, m: c in relevant_tests)}
+        method_level = {'test_classes': len(tests),
+                        'whole_test_classes': len(list(filter(lambda methods: methods is None, tests.values()))),
+                        'test_methods': sum(map(lambda item: len(tests_methods.get(item[0], [])) if item[
+                            1] is None else len(item[1]), tests.items())),
+                        'time': get_time(lambda c, m: c in tests and (tests[c] is None or m in tests[c]))}
+        report = {'class_level': class_level, 'method_level': method_level,
+                  'trigger_tests': len(trigger_tests), 'trigger_tests_reached': len(reached_trigger_tests),
+                  'methods_reduction': 1 - method_level['test_methods'] / class_level['test_methods'] if class_level[
+                      'test_methods'] else 0,
+                  'time_reduction': 1 - method_level['time'] / class_level['time'] if class_level['time'] else 0}
+        with open(self.test_selection_report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
 
     def triple(self):
         self.set_junit_formatter()
@@ -433,6 +649,91 @@ class Tracer:
         self.execute_grabber_process()
 
 
+class GrabberSession(object):
+    # runs the jcov grabber of a tracer on its own free ports: prepares the build file and the template, waits
+    # until the grabber accepts commands and makes sure it is stopped on exit
+    def __init__(self, tracer, timeout=60):
+        self.tracer = tracer
+        self.timeout = timeout
+        self.process = None
+
+    def __enter__(self):
+        self.tracer.allocate_ports()
+        self.tracer.set_junit_formatter()
+        self.tracer.execute_template_process()
+        self.process = self.tracer.execute_grabber_process(self.timeout)
+        return self.tracer
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.tracer.stop_grabber_process()
+            try:
+                self.process.wait(self.timeout)
+            except TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+
+class ForkedGrabberSession(object):
+    # runs the tests of a tracer in several forked test runs, each with its own build file, grabber and result file.
+    # the test classes are balanced between the forks by their historical times, and the forks results are merged
+    # into the result file of the tracer, so stop_grabber consumes one trace as with a single run
+    def __init__(self, tracer, forks, timeout=60):
+        self.tracer = tracer
+        self.forks = forks
+        self.timeout = timeout
+        self.sessions = []
+
+    def __enter__(self):
+        self.tracer.execute_template_process()
+        try:
+            for ind, tests in enumerate(self.tracer.split_tests(self.forks)):
+                fork = self.tracer.get_fork(ind, tests)
+                session = GrabberSession(fork, self.timeout)
+                fork.allocate_ports()
+                fork.set_junit_formatter()
+                session.process = fork.execute_grabber_process(self.timeout)
+                self.sessions.append(session)
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def run_tests(self, commands, stage, cmd_line, log_path=None):
+        # runs cmd_line (an ant command without -f) on every fork build file at once through commands, a
+        # CommandRunner, so every fork is recorded under stage. returns the exit codes
+        with ThreadPoolExecutor(max_workers=len(self.sessions) or 1) as executor:
+            return list(executor.map(
+                lambda item: commands.run(stage, f"{cmd_line} -f {shlex.quote(item[1].tracer.xml_path)}",
+                                          self.tracer.repo_path, f"{log_path}.fork_{item[0]}" if log_path else None),
+                enumerate(self.sessions)))
+
+    def stop_grabber(self, binary_details=False):
+        for session in self.sessions:
+            session.tracer.save_and_stop_grabber()
+        self.close()
+        if merge_jcov_results(list(map(lambda s: s.tracer.path_to_result_file, self.sessions)),
+                              self.tracer.path_to_result_file) is None:
+            print("no fork saved a jcov result")
+            return
+        self.tracer.process_result_file(binary_details)
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+            if os.path.exists(session.tracer.xml_path):
+                os.remove(session.tracer.xml_path)
+
+
 if __name__ == '__main__':
     t = Tracer(os.path.abspath(sys.argv[1]), sys.argv[2])
     if sys.argv[-1] == 'template':
@@ -455,5 +756,9 @@ if __name__ == '__main__':
         t.observe_tests()
     elif sys.argv[-1] == 'exclude_tests':
         t.exclude_tests()
+    elif sys.argv[-1] == 'exclude_tests_dry_run':
+        t.exclude_tests(dry_run=True)
+    elif sys.argv[-1] == 'binary_details':
+        t.stop_grabber(binary_details=True)
     else:
         t.stop_grabber()
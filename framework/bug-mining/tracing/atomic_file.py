@@ -0,0 +1,24 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    # writes a file under a unique temporary name in its directory and moves it into place, so concurrent writers of
+    # the same path never truncate each other's files and readers never see a partial file. the caches written this
+    # way are keyed by content, so a destination another writer created meanwhile is as good as ours
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            if not os.path.exists(path):
+                raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,83 @@
+import random
+import sys
+import time
+import timeit
+
+import networkx as nx
+
+from reachability import ReachabilityEngine
+from trace_information import HitInformationDecoder
+
+
+def random_hit_information(hits, seed=0):
+    rand = random.Random(seed)
+    return "[" + ",".join(map(lambda _: "[{0}]".format(",".join(map(str, [rand.randint(1, 1000)] + [
+        rand.randint(-1, 100000) for _ in range(HitInformationDecoder.FIELDS - 1)]))), range(hits))) + "]"
+
+
+def benchmark_hit_decoding(hits=100000, repeat=5):
+    hit_information = random_hit_information(hits)
+    assert list(HitInformationDecoder.decode(hit_information)) == [value for hit in eval(hit_information) for value in hit]
+    eval_time = timeit.timeit(lambda: eval(hit_information), number=repeat) / repeat
+    decoder_time = timeit.timeit(lambda: HitInformationDecoder.decode(hit_information), number=repeat) / repeat
+    print("hit decoding of {0} hits: eval {1:.4f}s, decoder {2:.4f}s ({3:.1f}x)".format(
+        hits, eval_time, decoder_time, eval_time / decoder_time))
+    return eval_time, decoder_time
+
+
+def pairwise_relevant_tests_and_nodes(graph, tests_classes, bugs_classes):
+    # the per pair search Tracer.create_call_graph used before ReachabilityEngine
+    relevant_tests = set()
+    for t in tests_classes:
+        for b in bugs_classes:
+            if t not in graph or b not in graph:
+                continue
+            if nx.has_path(graph, t, b):
+                relevant_tests.add(t)
+                break
+    g2 = nx.DiGraph(graph)
+    relevant_nodes = set(relevant_tests)
+    relevant_nodes.update(set(bugs_classes))
+    for t in relevant_tests:
+        if t not in g2:
+            continue
+        reachable = set(nx.single_source_shortest_path(g2, t).keys())
+        relevant_nodes.update(reachable)
+        g2.remove_nodes_from(reachable)
+    return relevant_tests, relevant_nodes
+
+
+def random_call_graph(nodes, edges, tests, seed=0):
+    rand = random.Random(seed)
+    graph = nx.gnm_random_graph(nodes, edges, seed=seed, directed=True)
+    graph = nx.relabel_nodes(graph, dict(map(lambda node: (node, "org.pkg.Class{0}".format(node)), graph.nodes)))
+    tests_classes = list(map(lambda ind: "org.pkg.Test{0}".format(ind), range(tests)))
+    for test in tests_classes:
+        graph.add_edges_from(map(lambda node: (test, node), rand.sample(list(graph.nodes)[:nodes], 3)))
+    return graph, tests_classes
+
+
+def benchmark_reachability(nodes=20000, edges=24000, tests=1000, bugs=20, use_condensation=False):
+    graph, tests_classes = random_call_graph(nodes, edges, tests)
+    bugs_classes = random.Random(1).sample(list(graph.nodes)[:nodes], bugs)
+    start = time.time()
+    expected = pairwise_relevant_tests_and_nodes(graph, tests_classes, bugs_classes)
+    pairwise_time = time.time() - start
+    start = time.time()
+    engine = ReachabilityEngine(graph, use_condensation)
+    relevant_tests = engine.get_relevant_tests(tests_classes, bugs_classes)
+    actual = relevant_tests, engine.get_relevant_nodes(relevant_tests, bugs_classes)
+    engine_time = time.time() - start
+    assert actual == expected
+    print("reachability of {0} tests to {1} bugs over {2} nodes: pairwise {3:.4f}s, engine {4:.4f}s ({5:.1f}x)".format(
+        tests, bugs, graph.number_of_nodes(), pairwise_time, engine_time, pairwise_time / engine_time))
+    return pairwise_time, engine_time
+
+
+BENCHMARKS = {'hits': benchmark_hit_decoding, 'reachability': benchmark_reachability,
+              'reachability_scc': lambda: benchmark_reachability(use_condensation=True)}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
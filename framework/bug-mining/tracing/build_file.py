@@ -0,0 +1,174 @@
+import xml.etree.cElementTree as et
+
+JUNIT_ATTRIBUTES = {'fork': 'true', 'forkmode': 'once', 'haltonerror': 'false', 'haltonfailure': 'false'}
+XML_FORMATTER_ATTRIBUTES = {'type': 'xml', 'usefile': 'true'}
+# the batchtests run only when this property is set while selected test elements are in the build file
+BATCHTEST_PROPERTY = 'trace.batchtest'
+
+
+class BuildFileEditor(object):
+    # loads an ant build file once and indexes its junit elements and their batchtest, fileset, formatter and
+    # jvmarg children. the changes are idempotent and the file is written once, only if one of them changed it
+    def __init__(self, xml_path):
+        self.xml_path = xml_path
+        self.element_tree = et.parse(xml_path)
+        self.changed = False
+        self.junits = []
+        for element in self.element_tree.iter():
+            if element.tag == 'junit':
+                self.junits.append(BuildFileEditor._index_junit(element))
+
+    @staticmethod
+    def _index_junit(junit):
+        index = {'junit': junit, 'formatter': None, 'jvmarg': None, 'filesets': [], 'batchtests': [],
+                 'tests': list(filter(lambda x: x.tag == 'test' and x.get('unless') == BATCHTEST_PROPERTY, junit))}
+        for element in junit.iter():
+            if element.tag in ['formatter', 'jvmarg'] and index[element.tag] is None:
+                index[element.tag] = element
+            elif element.tag == 'batchtest':
+                index['batchtests'].append(element)
+                fileset = next(filter(lambda x: x.tag == 'fileset', element.iter()), None)
+                if fileset is not None:
+                    index['filesets'].append(fileset)
+        return index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.write()
+
+    def _set_attributes(self, element, attributes):
+        if any(map(lambda item: element.get(item[0]) != item[1], attributes.items())):
+            element.attrib.update(attributes)
+            self.changed = True
+
+    def _get_or_create(self, index, tag):
+        if index[tag] is None:
+            index[tag] = et.SubElement(index['junit'], tag)
+            self.changed = True
+        return index[tag]
+
+    def set_junit_attributes(self, attributes=None):
+        for index in self.junits:
+            self._set_attributes(index['junit'], attributes or JUNIT_ATTRIBUTES)
+
+    def set_formatter(self, attributes=None):
+        for index in self.junits:
+            self._set_attributes(self._get_or_create(index, 'formatter'), attributes or XML_FORMATTER_ATTRIBUTES)
+
+    def set_jvmarg(self, value):
+        for index in self.junits:
+            self._set_attributes(self._get_or_create(index, 'jvmarg'), {'value': value})
+
+    def set_includes(self, names):
+        # the batchtests run exactly the given include patterns, all of their files when there are none
+        names = list(names or [])
+        for fileset in self.iter_filesets():
+            includes = list(filter(lambda x: x.tag == 'include', fileset.iter()))
+            if sorted(map(lambda x: x.get('name'), includes)) == sorted(names):
+                continue
+            for include in includes:
+                fileset.remove(include)
+            for name in names:
+                et.SubElement(fileset, 'include').attrib.update({'name': name})
+            self.changed = True
+
+    def add_excludes(self, names):
+        for fileset in self.iter_filesets():
+            excluded = set(map(lambda x: x.get('name'), filter(lambda x: x.tag == 'exclude', fileset.iter())))
+            for name in names or []:
+                if name not in excluded:
+                    excluded.add(name)
+                    et.SubElement(fileset, 'exclude').attrib.update({'name': name})
+                    self.changed = True
+
+    def set_test_methods(self, tests):
+        # runs test elements of the given classes, each on its methods or entirely when they are None, instead of the
+        # batchtests. the batchtests are restored when there are no tests
+        # a method with a parameters or invocation suffix (testFoo[0], testFoo()) matches nothing in ant, so its class
+        # runs entirely
+        selected = sorted(map(lambda item: (item[0], ','.join(sorted(item[1])) if item[1] and not any(
+            map(lambda m: '[' in m or '(' in m, item[1])) else None), (tests or {}).items()))
+        for index in self.junits:
+            if sorted(map(lambda test: (test.get('name'), test.get('methods')), index['tests'])) != selected:
+                list(map(index['junit'].remove, index['tests']))
+                todir = next(filter(None, map(lambda batchtest: batchtest.get('todir'), index['batchtests'])), None)
+                index['tests'] = []
+                for name, methods in selected:
+                    test = et.SubElement(index['junit'], 'test')
+                    test.attrib.update({'name': name, 'unless': BATCHTEST_PROPERTY})
+                    if methods:
+                        test.set('methods', methods)
+                    if todir:
+                        test.set('todir', todir)
+                    index['tests'].append(test)
+                self.changed = True
+            for batchtest in index['batchtests']:
+                if selected and batchtest.get('if') != BATCHTEST_PROPERTY:
+                    batchtest.set('if', BATCHTEST_PROPERTY)
+                    self.changed = True
+                elif not selected and batchtest.get('if') == BATCHTEST_PROPERTY:
+                    del batchtest.attrib['if']
+                    self.changed = True
+
+    def set_reports_dir(self, todir):
+        # the junit reports of the batchtests and selected tests go to todir
+        for index in self.junits:
+            for element in index['batchtests'] + index['tests']:
+                self._set_attributes(element, {'todir': todir})
+
+    @staticmethod
+    def _get_depends(target):
+        return list(filter(None, map(str.strip, target.get('depends', '').split(','))))
+
+    @staticmethod
+    def _expand_depends(name, targets, compiling, seen):
+        # a dependency, or the dependencies of a compiling one in its place
+        if name not in compiling:
+            return [name]
+        if name in seen:
+            return []
+        seen.add(name)
+        return [dependency for depends in BuildFileEditor._get_depends(targets[name])
+                for dependency in BuildFileEditor._expand_depends(depends, targets, compiling, seen)]
+
+    def skip_compilation(self):
+        # the targets no longer depend on the targets that compile, but still on the dependencies of those, and the
+        # junit targets no longer compile themselves, so the tests run on the classes that are already compiled
+        targets = dict(map(lambda target: (target.get('name'), target), self.element_tree.getroot().findall('target')))
+        compiling = set(map(lambda target: target.get('name'), filter(
+            lambda target: target.find('.//javac') is not None and target.find('.//junit') is None,
+            targets.values())))
+        for target in targets.values():
+            depends = BuildFileEditor._get_depends(target)
+            if not set(depends) & compiling:
+                continue
+            expanded = []
+            seen = set()
+            for name in depends:
+                for dependency in BuildFileEditor._expand_depends(name, targets, compiling, seen):
+                    if dependency not in expanded:
+                        expanded.append(dependency)
+            target.set('depends', ','.join(expanded))
+            if not expanded:
+                del target.attrib['depends']
+            self.changed = True
+        for target in filter(lambda t: t.find('.//junit') is not None, targets.values()):
+            for parent in list(target.iter()):
+                for javac in list(filter(lambda x: x.tag == 'javac', parent)):
+                    parent.remove(javac)
+                    self.changed = True
+
+    def iter_filesets(self):
+        for index in self.junits:
+            for fileset in index['filesets']:
+                yield fileset
+
+    def write(self):
+        if self.changed:
+            self.element_tree.write(self.xml_path, xml_declaration=True)
+            self.changed = False
+            return True
+        return False
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import zipfile
+from subprocess import Popen, PIPE
+
+from atomic_file import atomic_write
+
+EDGE_TYPES = ['(M)', '(I)', '(D)', '(S)', '(O)']
+EXCLUDED_PREFIXES = ['java.', 'org.junit', 'javax.']
+# sizes of the constant pool entries by tag, utf8 entries are sized by their length
+CONSTANT_POOL_SIZES = {3: 4, 4: 4, 5: 8, 6: 8, 7: 2, 8: 2, 9: 4, 10: 4, 11: 4, 12: 4, 15: 3, 16: 2, 17: 4, 18: 4,
+                       19: 2, 20: 2}
+
+
+def read_class_name(class_data):
+    # the binary name of the class defined by a class file, read from its constant pool
+    count = struct.unpack_from('>H', class_data, 8)[0]
+    offset = 10
+    utf8 = {}
+    classes = {}
+    ind = 1
+    while ind < count:
+        tag = class_data[offset]
+        if tag == 1:
+            length = struct.unpack_from('>H', class_data, offset + 1)[0]
+            utf8[ind] = class_data[offset + 3: offset + 3 + length].decode('utf-8', errors='replace')
+            offset += 3 + length
+        else:
+            if tag == 7:
+                classes[ind] = struct.unpack_from('>H', class_data, offset + 1)[0]
+            offset += 1 + CONSTANT_POOL_SIZES[tag]
+        ind += 2 if tag in [5, 6] else 1
+    this_class = struct.unpack_from('>H', class_data, offset + 2)[0]
+    return utf8[classes[this_class]].replace('/', '.')
+
+
+def normalize_class(name):
+    if ':' in name:
+        name = name.split(':')[0]
+    if '$' in name:
+        name = name.split('$')[0]
+    if name.startswith('['):
+        name = name[2:]
+    if '[' in name:
+        name = name.split('[')[0]
+    return name
+
+
+class JavacgEdgeReader(object):
+    # reads javacg output lines into class edges and method edges, normalizing every distinct symbol once
+    def __init__(self):
+        self.symbols = {}
+        self.methods = {}
+
+    def normalize(self, symbol):
+        name = self.symbols.get(symbol)
+        if name is None:
+            name = normalize_class(symbol)
+            if any(map(name.startswith, EXCLUDED_PREFIXES)):
+                name = ''
+            self.symbols[symbol] = name
+        return name
+
+    def get_method_name(self, symbol):
+        # the source level name of a javacg method symbol without its parameters: org.A$B:foo(int) is org.A.B.foo and
+        # constructors are named by their class, as in org.A.A
+        name = self.methods.get(symbol)
+        if name is None:
+            class_name, _, method_name = symbol.split('(')[0].partition(':')
+            class_name = class_name.replace('$', '.')
+            if method_name == '<init>':
+                method_name = class_name.split('.')[-1]
+            name = class_name + '.' + method_name
+            self.methods[symbol] = name
+        return name
+
+    def parse_line(self, line):
+        # returns the raw caller class, the normalized class edge and the method edge of a javacg output line
+        tokens = line[2:].split()
+        if len(tokens) != 2:
+            return None, None, None
+        caller, callee = list(map(lambda token: token[3:] if token[:3] in EDGE_TYPES else token, tokens))
+        caller_class = caller.split(':', 1)[0]
+        v, u = self.normalize(caller_class), self.normalize(callee.split(':', 1)[0])
+        if not (v and u):
+            return caller_class, None, None
+        method_edge = None
+        if line.startswith('M:'):
+            method_edge = (self.get_method_name(caller.split('(')[0]), self.get_method_name(callee.split('(')[0]))
+        return caller_class, (v, u) if v != u else None, method_edge
+
+    def iter_edges(self, lines):
+        # yields every distinct (raw caller class, edge type, edge) once, the edge types are classes and methods
+        seen = set()
+        for line in lines:
+            caller, class_edge, method_edge = self.parse_line(line)
+            for edge_type, edge in [('classes', class_edge), ('methods', method_edge)]:
+                if edge and (caller, edge_type, edge) not in seen:
+                    seen.add((caller, edge_type, edge))
+                    yield caller, edge_type, edge
+
+
+def iter_javacg_lines(call_graph_jar_path, jar_path):
+    # raises once the output is read when javacg failed, as its partial output is not the call graph of the jar
+    process = Popen(["java", "-jar", call_graph_jar_path, jar_path], stdout=PIPE, universal_newlines=True,
+                    errors='replace')
+    try:
+        for line in process.stdout:
+            yield line
+    finally:
+        process.stdout.close()
+        exit_code = process.wait()
+    if exit_code != 0:
+        raise RuntimeError("javacg failed with exit code {0} on {1}".format(exit_code, jar_path))
+
+
+class CallGraphCache(object):
+    # normalized class edges and method edges of every class file, keyed by the hash of its content
+    VERSION = 2
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def get_digest(class_data):
+        return hashlib.sha1(class_data).hexdigest()
+
+    def _get_path(self, digest):
+        return os.path.join(self.cache_dir, "v{0}".format(CallGraphCache.VERSION), digest[:2], digest + '.json')
+
+    def get(self, digest):
+        path = self._get_path(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            edges = json.loads(f.read())
+        return dict(map(lambda edge_type: (edge_type, list(map(tuple, edges[edge_type]))), edges))
+
+    def put(self, digest, edges):
+        path = self._get_path(digest)
+        if os.path.exists(path):
+            return
+        with atomic_write(path) as f:
+            json.dump(dict(map(lambda edge_type: (edge_type, sorted(edges[edge_type])), edges)), f)
+
+
+def iter_jar_classes(jar_path):
+    with zipfile.ZipFile(jar_path) as jar:
+        for entry in jar.namelist():
+            if entry.endswith('.class'):
+                yield entry, jar.read(entry)
+
+
+def iter_dirs_classes(class_roots):
+    # the class files under the class roots, each file once even when the roots are nested
+    seen = set()
+    for class_root in class_roots:
+        for root, dirs, files in os.walk(class_root):
+            dirs[:] = list(filter(lambda d: d != '.git', dirs))
+            for f in files:
+                path = os.path.realpath(os.path.join(root, f))
+                if not f.endswith('.class') or path in seen:
+                    continue
+                seen.add(path)
+                with open(path, 'rb') as class_file:
+                    yield os.path.relpath(os.path.join(root, f), class_root), class_file.read()
+
+
+def get_call_graph_edges(call_graph_jar_path, class_files, cache):
+    # the class level and the method level call graph edges of (name, class file content) pairs, as a dict by edge
+    # type. cached classes are reused and only the classes not in the cache are analysed by javacg, in one jar. only
+    # the classes whose name was read are cached, and nothing is cached when javacg fails
+    edges = {'classes': set(), 'methods': set()}
+    missing = {}
+    for name, class_data in class_files:
+        digest = CallGraphCache.get_digest(class_data)
+        cached = cache.get(digest)
+        if cached is None:
+            missing[digest] = (name, class_data)
+        else:
+            list(map(lambda edge_type: edges[edge_type].update(cached[edge_type]), cached))
+    if not missing:
+        return edges
+    digests_by_class = {}
+    fd, missing_jar = tempfile.mkstemp(suffix='.jar')
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(missing_jar, 'w') as jar:
+            for ind, (digest, (name, class_data)) in enumerate(missing.items()):
+                jar.writestr("{0}/{1}".format(ind, os.path.basename(name)), class_data)
+                try:
+                    digests_by_class.setdefault(read_class_name(class_data), []).append(digest)
+                except Exception as e:
+                    print(e, name)
+        edges_by_digest = dict(map(lambda digest: (digest, {'classes': set(), 'methods': set()}),
+                                   sum(digests_by_class.values(), [])))
+        for caller, edge_type, edge in JavacgEdgeReader().iter_edges(
+                iter_javacg_lines(call_graph_jar_path, missing_jar)):
+            for digest in digests_by_class.get(caller, []):
+                edges_by_digest[digest][edge_type].add(edge)
+            edges[edge_type].add(edge)
+    finally:
+        os.remove(missing_jar)
+    for digest, digest_edges in edges_by_digest.items():
+        cache.put(digest, digest_edges)
+    return edges
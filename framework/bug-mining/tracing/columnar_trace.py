@@ -0,0 +1,255 @@
+from collections import Counter
+
+import numpy as np
+try:
+    from scipy.sparse import csr_matrix
+except ImportError:
+    # only to_csr needs scipy
+    csr_matrix = None
+
+from trace_information import HitInformationDecoder
+
+HIT_FIELDS = ['count', 'previous_slot', 'parent', 'test_slot', 'test_parent', 'test_previous']
+HIT_DTYPE = np.dtype([('method', np.int32)] + list(map(lambda field: (field, np.int64), HIT_FIELDS)))
+TEST_KEY_FIELDS = ['test_slot', 'test_parent', 'test_previous']
+NO_METHOD = -1
+
+
+class MethodTable(object):
+    # names of the traced methods, shared by all the traces of a parser. methods are referenced by their index
+    def __init__(self):
+        self.names = []
+        self.ids = []
+        self.extra_slots = []
+        self.index_by_id = {}
+        self.index_by_slot = {}
+
+    @staticmethod
+    def from_dicts(method_name_by_id, method_name_by_extra_slot):
+        table = MethodTable()
+        slot_by_name = dict(map(lambda item: (item[1], item[0]), method_name_by_extra_slot.items()))
+        for method_id, method_name in method_name_by_id.items():
+            table.add_method(method_id, slot_by_name.get(method_name), method_name)
+        for extra_slot, method_name in method_name_by_extra_slot.items():
+            if extra_slot not in table.index_by_slot:
+                table.index_by_slot[extra_slot] = table.names.index(method_name)
+        return table
+
+    def add_method(self, method_id, extra_slot, method_name):
+        index = self.index_by_id.get(method_id)
+        if index is None:
+            index = len(self.names)
+            self.names.append(method_name)
+            self.ids.append(method_id)
+            self.extra_slots.append(-1 if extra_slot is None else extra_slot)
+            self.index_by_id[method_id] = index
+        # elements without a slot of their own (extra_slots -1) can not be referenced by slot
+        if extra_slot is not None and extra_slot > 0:
+            self.index_by_slot[extra_slot] = index
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_name(self, index):
+        return 'None' if index == NO_METHOD else self.names[index]
+
+    def resolve(self, values, present=None):
+        # maps slots/ids to method indices the same way as HitInformation.set_previous_method: the extra slots
+        # first, then the ids. when present is given only these methods can be resolved
+        uniques, inverse = np.unique(values, return_inverse=True)
+        resolved = np.fromiter(map(lambda value: self._resolve_value(int(value), present), uniques), dtype=np.int32,
+                               count=len(uniques))
+        return resolved[inverse.reshape(-1)]
+
+    def _resolve_value(self, value, present):
+        for table in [self.index_by_slot, self.index_by_id]:
+            index = table.get(value)
+            if index is not None and (present is None or present[index]):
+                return index
+        return NO_METHOD
+
+
+class ColumnarTrace(object):
+    def __init__(self, test_name, method_table, methods, hits, restrict_to_present=False):
+        self.test_name = test_name
+        self.method_table = method_table
+        self.methods = methods
+        self.hits = hits
+        self.present = None
+        if restrict_to_present:
+            self.present = np.zeros(len(method_table), dtype=bool)
+            self.present[methods] = True
+
+    @staticmethod
+    def from_trace(trace, method_table):
+        methods = np.fromiter(map(lambda element: method_table.index_by_id[element.id], trace.trace.values()),
+                              dtype=np.int32, count=len(trace.trace))
+        hits = np.zeros(sum(map(lambda element: len(element.hits_information), trace.trace.values())), dtype=HIT_DTYPE)
+        ind = 0
+        for method, element in zip(methods, trace.trace.values()):
+            for hit in element.hits_information:
+                hits[ind] = (method, hit.count, hit.previous_slot, hit.parent, hit.test_slot, hit.test_parent,
+                             hit.test_previous)
+                ind += 1
+        return ColumnarTrace(trace.test_name, method_table, methods, hits)
+
+    @staticmethod
+    def from_values(test_name, method_table, methods, hit_methods, hit_values):
+        # hit_methods is the method index of every hit, hit_values the decoded HitInformation rows
+        hits = np.empty(len(hit_methods), dtype=HIT_DTYPE)
+        hits['method'] = np.frombuffer(hit_methods, dtype=np.int32) if len(hit_methods) else []
+        values = np.frombuffer(hit_values, dtype=np.int64).reshape(-1, HitInformationDecoder.FIELDS) if len(
+            hit_values) else np.empty((0, HitInformationDecoder.FIELDS), dtype=np.int64)
+        for ind, field in enumerate(HIT_FIELDS):
+            hits[field] = values[:, ind]
+        return ColumnarTrace(test_name, method_table, np.asarray(methods, dtype=np.int32), hits)
+
+    def get_method_names(self):
+        return list(map(self.method_table.get_name, self.methods.tolist()))
+
+    def get_trace(self, trace_granularity='methods'):
+        if trace_granularity == 'methods':
+            names = self.get_method_names()
+        elif trace_granularity == 'files':
+            names = list(map(lambda name: ".".join((name.split("(")[0].split(".")[:-1])), self.get_method_names()))
+        else:
+            assert False
+        return list(set(map(lambda name: name.lower().replace("java.lang.", "").replace("java.io.", "").replace(
+            "java.util.", ""), names)))
+
+    def _get_edges(self, source_field):
+        sources = self.method_table.resolve(self.hits[source_field], self.present)
+        pairs = np.unique(np.stack([sources, self.hits['method']], axis=1), axis=0) if len(self.hits) else []
+        return set(map(lambda pair: (self.method_table.get_name(pair[0]), self.method_table.get_name(pair[1])),
+                       map(tuple, np.asarray(pairs).tolist())))
+
+    def _get_edges_num(self, source_field):
+        extra_slots = np.asarray(self.method_table.extra_slots, dtype=np.int64)
+        pairs = np.unique(np.stack([self.hits[source_field], extra_slots[self.hits['method']]], axis=1),
+                          axis=0) if len(self.hits) else []
+        return set(map(tuple, np.asarray(pairs).tolist()))
+
+    def aggregate_edges(self, source_field='parent'):
+        # (source, target, count) arrays of method indices, counting how many times every edge was traversed.
+        # sources that do not resolve to a method are NO_METHOD
+        if not len(self.hits):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        sources = self.method_table.resolve(self.hits[source_field], self.present).astype(np.int64) + 1
+        targets = self.hits['method'].astype(np.int64)
+        edges, inverse = np.unique(sources * len(self.method_table) + targets, return_inverse=True)
+        counts = np.bincount(inverse.reshape(-1), weights=self.hits['count'], minlength=len(edges)).astype(np.int64)
+        return edges // len(self.method_table) - 1, edges % len(self.method_table), counts
+
+    def count_edges(self, source_field='parent'):
+        sources, targets, counts = self.aggregate_edges(source_field)
+        counter = Counter()
+        for source, target, count in zip(sources.tolist(), targets.tolist(), counts.tolist()):
+            counter[(self.method_table.get_name(source), self.method_table.get_name(target))] += count
+        return counter
+
+    def to_csr(self, source_field='parent'):
+        # compressed sparse adjacency of the edges, weighted by their counts, and the names of its nodes. it can be
+        # loaded with networkx.from_scipy_sparse_array(matrix, create_using=networkx.DiGraph)
+        if csr_matrix is None:
+            raise ImportError("ColumnarTrace.to_csr requires scipy, install it with pip install scipy")
+        sources, targets, counts = self.aggregate_edges(source_field)
+        nodes = np.unique(np.concatenate([sources, targets]))
+        matrix = csr_matrix((counts, (np.searchsorted(nodes, sources), np.searchsorted(nodes, targets))),
+                            shape=(len(nodes), len(nodes)))
+        return list(map(self.method_table.get_name, nodes.tolist())), matrix
+
+    def count_execution_edges(self):
+        return self.count_edges('previous_slot')
+
+    def count_call_graph_edges(self):
+        return self.count_edges('parent')
+
+    def get_execution_csr(self):
+        return self.to_csr('previous_slot')
+
+    def get_call_graph_csr(self):
+        return self.to_csr('parent')
+
+    def get_execution_edges(self):
+        return self._get_edges('previous_slot')
+
+    def get_call_graph_edges(self):
+        return self._get_edges('parent')
+
+    def get_execution_edges_num(self):
+        return self._get_edges_num('previous_slot')
+
+    def get_call_graph_edges_num(self):
+        return self._get_edges_num('parent')
+
+    def _get_tests_renames(self):
+        # maps the (test slot, test parent, test previous) of a hit to the name of the test that owns it, the same way
+        # as the renames table of Trace.split_to_subtraces
+        names = self.get_method_names()
+        tests = list(filter(lambda ind: names[ind].split('.')[-2].endswith('Test'), range(len(names))))
+        order = np.argsort(self.hits['method'], kind='stable')
+        sorted_methods = self.hits['method'][order]
+        starts = np.searchsorted(sorted_methods, self.methods[tests], side='left')
+        ends = np.searchsorted(sorted_methods, self.methods[tests], side='right')
+        tests_slots = {}
+        renames = {}
+        for ind, start, end in zip(tests, starts.tolist(), ends.tolist()):
+            if start == end:
+                continue
+            method = int(self.methods[ind])
+            method_id, extra_slot = self.method_table.ids[method], self.method_table.extra_slots[method]
+            test_hits = self.hits[order[start:end]]
+            key = (method_id, int(test_hits['parent'][0]), int(test_hits['previous_slot'][0]))
+            tests_slots[key] = names[ind]
+            for parent, previous_slot in zip(test_hits['parent'].tolist(), test_hits['previous_slot'].tolist()):
+                renames[(method_id, parent, previous_slot)] = key
+                renames[(extra_slot, parent, previous_slot)] = key
+        tests_names = list(dict.fromkeys(map(lambda ind: names[ind], tests)))
+        return tests_names, dict(map(lambda item: (item[0], tests_slots[item[1]]), renames.items()))
+
+    def split_to_subtraces(self):
+        # partitions the hits by their test key in one pass and returns the same per test traces as
+        # Trace.split_to_subtraces, including the unknown_* traces of hits that no test owns
+        tests_names, renames = self._get_tests_renames()
+        selected = np.flatnonzero(self.hits['test_slot'] != -1)
+        if not len(selected):
+            return {}
+        keys = np.stack(list(map(lambda field: self.hits[field][selected], TEST_KEY_FIELDS)), axis=1)
+        unique_keys, first_hit, groups = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        groups = groups.reshape(-1)
+        buckets_names = list(tests_names)
+        bucket_by_name = dict(map(lambda item: (item[1], item[0]), enumerate(buckets_names)))
+        group_buckets = np.empty(len(unique_keys), dtype=np.int64)
+        for group in np.argsort(first_hit, kind='stable').tolist():
+            key = tuple(unique_keys[group].tolist())
+            name = renames.get(key) or 'unknown_' + '_'.join(list(map(str, key)))
+            if name not in bucket_by_name:
+                bucket_by_name[name] = len(buckets_names)
+                buckets_names.append(name)
+            group_buckets[group] = bucket_by_name[name]
+        # an element whose hits belong to several groups of the same test keeps only the hits of its last group
+        methods = self.hits['method'][selected].astype(np.int64)
+        pairs, pairs_first, pairs_inverse = np.unique(methods * len(unique_keys) + groups, return_index=True,
+                                                      return_inverse=True)
+        pairs_buckets = group_buckets[pairs % len(unique_keys)]
+        method_buckets = (pairs // len(unique_keys)) * len(buckets_names) + pairs_buckets
+        by_last_group = np.lexsort((-pairs_first, method_buckets))
+        _, last = np.unique(method_buckets[by_last_group], return_index=True)
+        chosen = np.zeros(len(pairs), dtype=bool)
+        chosen[by_last_group[last]] = True
+        kept = chosen[pairs_inverse.reshape(-1)]
+        hits_buckets = pairs_buckets[pairs_inverse.reshape(-1)][kept]
+        hits = self.hits[selected[kept]]
+        order = np.argsort(hits_buckets, kind='stable')
+        hits, hits_buckets = hits[order], hits_buckets[order]
+        bounds = np.searchsorted(hits_buckets, np.arange(len(buckets_names) + 1))
+        traces = {}
+        for bucket, name in enumerate(buckets_names):
+            bucket_hits = hits[bounds[bucket]:bounds[bucket + 1]]
+            if not len(bucket_hits):
+                continue
+            methods_first = np.unique(bucket_hits['method'], return_index=True)[1]
+            traces[name] = ColumnarTrace(name, self.method_table, bucket_hits['method'][np.sort(methods_first)],
+                                         bucket_hits, restrict_to_present=True)
+        return traces
@@ -0,0 +1,114 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from subprocess import Popen, STDOUT
+
+
+def get_tree_rss(pid):
+    # the resident memory in KB of a process and all its descendants, read from /proc (0 where it is not available)
+    children = {}
+    rss = {}
+    page_kb = resource.getpagesize() // 1024
+    for entry in filter(str.isdigit, os.listdir('/proc') if os.path.isdir('/proc') else []):
+        try:
+            with open(os.path.join('/proc', entry, 'stat')) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * page_kb
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += rss.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total
+
+
+class RssSampler(threading.Thread):
+    # samples the resident memory of a process tree until stopped and keeps the peak
+    def __init__(self, pid, interval=0.2):
+        super(RssSampler, self).__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, get_tree_rss(self.pid))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+class CommandRunner(object):
+    # runs the shell commands of the pipeline and records for each one its stage, wall time, cpu time, peak resident
+    # memory of its process tree, exit code and log as a json line, and as an event of a chrome trace (load it in
+    # chrome://tracing or perfetto) to inspect the stages on a timeline
+    def __init__(self, metrics_path, trace_path=None):
+        self.metrics_path = metrics_path
+        self.trace_path = trace_path
+        # commands may run at once from several threads, as the forked test runs do
+        self.lock = threading.Lock()
+
+    def record(self, metrics):
+        with self.lock:
+            self._record(metrics)
+
+    def _record(self, metrics):
+        with open(self.metrics_path, 'a') as f:
+            f.write(json.dumps(metrics) + '\n')
+        if not self.trace_path:
+            return
+        # the array format without the closing bracket, which the trace viewers accept, so events are only appended
+        new_trace = not os.path.exists(self.trace_path)
+        with open(self.trace_path, 'a') as f:
+            if new_trace:
+                f.write('[\n')
+            event = {'name': metrics.get('command') or metrics['stage'], 'cat': metrics['stage'], 'ph': 'X',
+                     'ts': int(metrics['start'] * 1e6), 'dur': int(metrics['wall_time'] * 1e6), 'pid': os.getpid(),
+                     'tid': 1 if metrics.get('command') else 0, 'args': metrics}
+            f.write(json.dumps(event) + ',\n')
+
+    def run(self, stage, command, cwd=None, log_path=None):
+        # runs a shell command, with its output in log_path when given, and returns its exit code
+        log = open(log_path, 'w') if log_path else None
+        start = time.time()
+        try:
+            process = Popen(command, shell=True, cwd=cwd, stdout=log, stderr=STDOUT if log else None)
+            sampler = RssSampler(process.pid)
+            sampler.start()
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            peak_rss = sampler.stop()
+        finally:
+            if log:
+                log.close()
+        self.record({'stage': stage, 'command': command, 'cwd': cwd, 'log': log_path, 'start': start,
+                     'wall_time': time.time() - start, 'user_time': usage.ru_utime, 'system_time': usage.ru_stime,
+                     'peak_tree_rss_kb': peak_rss, 'max_rss_kb': usage.ru_maxrss, 'exit_code': process.returncode})
+        return process.returncode
+
+    @contextmanager
+    def span(self, stage):
+        # records a whole stage, its cpu time includes the commands it ran and waited for
+        start = time.time()
+        before = list(map(resource.getrusage, [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]))
+        status = 'failed'
+        try:
+            yield
+            status = 'done'
+        finally:
+            after = list(map(resource.getrusage, [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]))
+            self.record({'stage': stage, 'command': None, 'start': start, 'wall_time': time.time() - start,
+                         'user_time': sum(map(lambda u: u[1].ru_utime - u[0].ru_utime, zip(before, after))),
+                         'system_time': sum(map(lambda u: u[1].ru_stime - u[0].ru_stime, zip(before, after))),
+                         'max_rss_kb': max(map(lambda u: u.ru_maxrss, after)), 'status': status})
@@ -0,0 +1,78 @@
+import json
+import os
+import re
+from collections import namedtuple
+
+Diagnostic = namedtuple('Diagnostic', ['path', 'line', 'kind', 'message'])
+
+# javac diagnostics as printed by ant ([javac] /a/B.java:12: error: msg, or without error: on old javac) and by maven
+# ([ERROR] /a/B.java:[12,5] msg)
+DIAGNOSTIC_PATTERN = re.compile(r'(?P<path>(?:[A-Za-z]:)?[^\s:\[\]]+\.java):(?:\[(?P<bracket_line>\d+)(?:,\d+)?\]|'
+                                r'(?P<line>\d+):)\s*(?:(?P<kind>error|warning):)?\s*(?P<message>.*)')
+
+
+def parse_javac_diagnostics(lines):
+    diagnostics = []
+    for line in lines:
+        match = DIAGNOSTIC_PATTERN.search(line)
+        if match is None:
+            continue
+        kind = match.group('kind') or ('warning' if 'WARNING' in line[:match.start()] else 'error')
+        diagnostics.append(Diagnostic(match.group('path'), int(match.group('line') or match.group('bracket_line')), kind,
+                                      match.group('message').strip()))
+    return diagnostics
+
+
+class CompileRepair(object):
+    # compiles the tests and removes the test sources that javac reports errors in, until the compilation is clean,
+    # only errors outside the tests are left or max_iterations compilations ran. the compile command is expected to
+    # be incremental (ant javac recompiles only the sources that are newer than their classes), so the next
+    # iterations compile only what the removals affected
+    def __init__(self, repo_dir, compile_tests, log_path, summary_path=None, max_iterations=10):
+        self.repo_dir = os.path.realpath(repo_dir)
+        # runs the compilation with its output in log_path and returns its exit code
+        self.compile_tests = compile_tests
+        self.log_path = log_path
+        self.summary_path = summary_path
+        self.max_iterations = max_iterations
+
+    def get_errors(self):
+        with open(self.log_path, errors='replace') as f:
+            diagnostics = parse_javac_diagnostics(f)
+        errors = {}
+        for diagnostic in filter(lambda d: d.kind == 'error', diagnostics):
+            path = os.path.realpath(os.path.join(self.repo_dir, diagnostic.path))
+            if path.startswith(self.repo_dir + os.sep):
+                errors.setdefault(path, []).append(diagnostic)
+        return errors
+
+    def is_test_source(self, path):
+        return 'test' in os.path.relpath(path, self.repo_dir).lower()
+
+    def run(self):
+        summary = {'status': 'max_iterations', 'removed': [], 'iterations': [], 'errors': {}}
+        for iteration in range(self.max_iterations):
+            exit_code = self.compile_tests()
+            errors = self.get_errors() if os.path.exists(self.log_path) else {}
+            removable = sorted(filter(lambda path: self.is_test_source(path) and os.path.exists(path), errors))
+            summary['iterations'].append({'iteration': iteration, 'exit_code': exit_code,
+                                          'errors': sum(map(len, errors.values())),
+                                          'removed': list(map(lambda path: os.path.relpath(path, self.repo_dir),
+                                                              removable))})
+            summary['errors'] = dict(map(lambda item: (os.path.relpath(item[0], self.repo_dir),
+                                                       list(map(lambda d: f"{d.line}: {d.message}", item[1]))),
+                                         errors.items()))
+            if exit_code == 0 and not errors:
+                summary['status'] = 'clean'
+                break
+            if not removable:
+                summary['status'] = 'unrepairable' if errors else 'failed'
+                break
+            for path in removable:
+                print("remove test file with compilation errors " + path)
+                os.remove(path)
+                summary['removed'].append(os.path.relpath(path, self.repo_dir))
+        if self.summary_path:
+            with open(self.summary_path, 'w') as f:
+                json.dump(summary, f, indent=2)
+        return summary
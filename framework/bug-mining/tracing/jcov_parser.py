@@ -1,10 +1,17 @@
 import functools
+import glob
+import hashlib
 import os
-import gc
+import pickle
 import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import zip_longest
 import xml.etree.cElementTree as et
-from functools import reduce
-from trace_information import Signature, TraceElement, Trace
+from xml.sax.saxutils import quoteattr
+from array import array
+from atomic_file import atomic_write
+from columnar_trace import ColumnarTrace, MethodTable
+from trace_information import Signature, TraceElement, Trace, HitInformationDecoder
 
 
 class JcovParser(object):
@@ -12,7 +19,8 @@ class JcovParser(object):
     METH = "<meth"
     METHENTER = "<meth"
 
-    def __init__(self, xml_folder_dir=None, files=None, instrument_only_methods=True, short_type=True):
+    def __init__(self, xml_folder_dir=None, files=None, instrument_only_methods=True, short_type=True, streaming=False,
+                 template_path=None):
         self.target_dir = None
         if xml_folder_dir:
             self.target_dir = xml_folder_dir
@@ -21,31 +29,152 @@ class JcovParser(object):
         else:
             self.jcov_files = files
         self.instrument_only_methods = instrument_only_methods
+        self.short_type = short_type
+        self.streaming = streaming
+        self.template_path = template_path
         self.prefixes = set()
         if self.instrument_only_methods:
             self.prefixes.add(JcovParser.METH)
-        self.method_name_by_id, self.method_name_by_extra_slot = self._get_method_ids(short_type)
-        self.lines_to_read = self._get_methods_lines()
+        self.method_ids_cache_path = self._get_method_ids_cache_path(short_type)
+        cached = self._load_cached_method_ids()
+        # the streaming parsing fills the method tables while the jcov files are streamed, unless they are cached
+        self.method_tables_cached = cached is not None
+        if cached is not None:
+            self.method_name_by_id, self.method_name_by_extra_slot = cached
+        elif self.streaming:
+            self.method_name_by_id, self.method_name_by_extra_slot = {}, {}
+        else:
+            self.method_name_by_id, self.method_name_by_extra_slot = self._get_method_ids(short_type)
+            self._save_cached_method_ids()
+
+    def parse(self, delete_dir_when_finished=False, workers=1):
+        # workers > 1 (or None for one per core) parses the jcov files, as the per test files of xml_folder_dir, in a
+        # process pool and yields the traces as they complete, in no particular order
+        if workers == 1:
+            traces = self._parse_files()
+        else:
+            traces = self._parse_files_in_pool(workers)
+        for trace in traces:
+            yield trace
+        self._save_cached_method_ids()
+        if delete_dir_when_finished:
+            shutil.rmtree(self.target_dir)
+
+    def _parse_files(self):
+        for jcov_file in self.jcov_files:
+            try:
+                yield self._parse_file(jcov_file)
+            except Exception as e:
+                print(e)
+
+    def _parse_files_in_pool(self, workers):
+        # every worker creates its parser once, and loads the method tables from the template cache that this parser
+        # saved, instead of receiving them pickled. without a template every worker builds the tables itself
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                                 initargs=(self.jcov_files, self.instrument_only_methods, self.short_type,
+                                           self.streaming, self.template_path)) as executor:
+            futures = list(map(lambda jcov_file: executor.submit(_parse_file_in_worker, jcov_file), self.jcov_files))
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    print(e)
+
+    def _parse_file(self, jcov_file):
+        test_name = os.path.splitext(os.path.basename(jcov_file))[0].lower()
+        if self.streaming:
+            return self._stream_jcov_file(jcov_file, test_name)
+        return self._parse_jcov_file(jcov_file, test_name)
 
-    def parse(self, delete_dir_when_finished=False):
+    def parse_columnar(self, delete_dir_when_finished=False):
+        self.method_table = MethodTable()
         for jcov_file in self.jcov_files:
             test_name = os.path.splitext(os.path.basename(jcov_file))[0].lower()
             try:
-                yield self._parse_jcov_file(jcov_file, test_name)
+                yield self._parse_columnar_jcov_file(jcov_file, test_name)
             except Exception as e:
                 print(e)
+        self._save_cached_method_ids()
         if delete_dir_when_finished:
             shutil.rmtree(self.target_dir)
 
+    def _parse_columnar_jcov_file(self, jcov_file, test_name):
+        methods = []
+        hit_methods = array('i')
+        hit_values = array('q')
+        for data in self._iter_trace_data(jcov_file):
+            method_id = int(data['id'])
+            index = self.method_table.add_method(method_id, int(data.get('extra_slots', -1)),
+                                                 self.method_name_by_id[method_id])
+            if int(data['count']) == 0:
+                continue
+            methods.append(index)
+            values = HitInformationDecoder.decode(data['HitInformation'])
+            hit_methods.extend([index] * (len(values) // HitInformationDecoder.FIELDS))
+            hit_values.extend(values)
+        return ColumnarTrace.from_values(test_name, self.method_table, methods, hit_methods, hit_values)
+
     def _parse_jcov_file(self, jcov_file, test_name):
-        gc.collect()
         trace = self._get_trace_for_file(jcov_file)
         list(map(lambda element: element.set_previous_method(self.method_name_by_extra_slot, self.method_name_by_id), trace.values()))
         return Trace(test_name, trace)
 
+    def _stream_jcov_file(self, jcov_file, test_name):
+        trace = {}
+        for data in self._iter_trace_data(jcov_file):
+            trace_element = TraceElement(data, self.method_name_by_id)
+            if trace_element.have_count():
+                assert trace_element.id not in trace
+                trace[trace_element.id] = trace_element
+        list(map(lambda element: element.set_previous_method(self.method_name_by_extra_slot, self.method_name_by_id), trace.values()))
+        return Trace(test_name, trace)
+
+    def _iter_trace_data(self, jcov_file):
+        # single pass over the file: registers every method in the method tables and yields the jcov data of the
+        # elements to trace, clearing the parsed elements so memory does not grow with the file size
+        package_name = class_name = method_name = None
+        root = None
+        for event, element in et.iterparse(jcov_file, events=('start', 'end')):
+            tag = element.tag.split('}')[-1]
+            if event == 'start':
+                if root is None:
+                    root = element
+                elif tag == 'package':
+                    package_name = element.attrib['name']
+                elif tag == 'class' and package_name is not None:
+                    class_name = element.attrib['name']
+                elif tag == 'meth' and class_name is not None:
+                    if self.method_tables_cached and self.instrument_only_methods:
+                        method_name = self.method_name_by_id.get(int(element.attrib['id']))
+                        if method_name is not None:
+                            continue
+                    method_name = JcovParser._get_method_name(package_name, class_name, element, self.short_type)
+                    if self.instrument_only_methods:
+                        self.method_name_by_id[int(element.attrib['id'])] = method_name
+                        self.method_name_by_extra_slot[int(element.attrib['extra_slots'])] = method_name
+                continue
+            if tag == 'meth' and method_name is not None:
+                if self.instrument_only_methods:
+                    yield dict(element.attrib)
+                method_name = None
+                element.clear()
+            elif tag == 'class':
+                class_name = None
+                element.clear()
+            elif tag == 'package':
+                package_name = None
+                element.clear()
+                root.clear()
+            elif method_name is not None and element.attrib.get('id') and not self.instrument_only_methods:
+                if not self.method_tables_cached:
+                    self.prefixes.add("<" + tag)
+                    self.method_name_by_id[int(element.attrib['id'])] = method_name + "." + tag
+                yield dict(element.attrib)
+                element.clear()
+
     def _get_trace_for_file(self, jcov_file):
         trace = {}
-        for method in self._get_lines_by_inds(jcov_file):
+        for method in self._get_methods_lines(jcov_file):
             prefix = list(filter(lambda prefix: method.startswith(prefix), self.prefixes))[0]
             data = dict(list(map(lambda val: val.split('='),
                             method[len(prefix) + 1:-len(JcovParser.CLOSER)].replace('"', "").split())))
@@ -55,43 +184,69 @@ class JcovParser(object):
                 trace[trace_element.id] = trace_element
         return trace
 
-    def _get_lines_by_inds(self, file_path):
+    def _get_methods_lines(self, file_path):
+        # the element lines of a jcov file, read line by line instead of by the indices of the lines in the result
+        # file, so neither the result file nor its line indices are needed when the method tables are cached
         with open(file_path) as f:
-            enumerator_next_ind = 0
-            for ind in self.lines_to_read:
-                list(map(functools.partial(next, f), range(enumerator_next_ind, ind)))
-                enumerator_next_ind = ind + 1
-                yield next(f).strip()
-
-    def _get_methods_lines(self):
-        with open(list(filter(lambda x: 'result' in os.path.basename(x).lower(), self.jcov_files))[0]) as f:
-            return list(map(lambda line: line[0], filter(lambda line: any(list(map(lambda prefix: prefix in line[1], self.prefixes))), filter(lambda line: JcovParser.CLOSER in line[1], enumerate(f.readlines())))))
+            for line in f:
+                if JcovParser.CLOSER in line and any(map(lambda prefix: prefix in line, self.prefixes)):
+                    yield line.strip()
 
     @staticmethod
     def get_children_by_name(element, name):
-        return list(filter(lambda e: e.tag.endswith(name), element.getchildren()))
+        return list(filter(lambda e: e.tag.endswith(name), list(element)))
 
     @staticmethod
     def get_elements_by_path(root, path):
         elements = [([], root)]
         for name in path:
-            elements = reduce(list.__add__,
-                              list(map(lambda elem: list(map(lambda child: (elem[0] + [child], child),
-                                                   JcovParser.get_children_by_name(elem[1], name))), elements)), [])
+            elements = [(elem_path + [child], child) for elem_path, elem in elements
+                        for child in JcovParser.get_children_by_name(elem, name)]
         return elements
 
+    def _get_method_ids_cache_path(self, short_type):
+        # the method tables only change with the jcov template, so they are cached next to it keyed by its hash
+        if not self.template_path or not os.path.exists(self.template_path):
+            return None
+        sha = hashlib.sha1()
+        with open(self.template_path, 'rb') as f:
+            for chunk in iter(functools.partial(f.read, 1 << 20), b''):
+                sha.update(chunk)
+        return "{0}.{1}.{2}.{3}.cache".format(self.template_path, sha.hexdigest(), 'short' if short_type else 'long',
+                                               'methods' if self.instrument_only_methods else 'blocks')
+
+    def _load_cached_method_ids(self):
+        if not self.method_ids_cache_path or not os.path.exists(self.method_ids_cache_path):
+            return None
+        try:
+            with open(self.method_ids_cache_path, 'rb') as f:
+                method_ids, method_slots, prefixes = pickle.load(f)
+            self.prefixes.update(prefixes)
+            return method_ids, method_slots
+        except Exception as e:
+            print(e)
+            return None
+
+    def _save_cached_method_ids(self):
+        # the streaming parsing saves the tables it filled once its files are parsed
+        if self.method_tables_cached or not self.method_ids_cache_path or not self.method_name_by_id:
+            return
+        template_hash_prefix = os.path.basename(self.method_ids_cache_path).split('.')[:-3]
+        for stale_cache in glob.glob(glob.escape(self.template_path) + ".*.cache"):
+            if os.path.basename(stale_cache).split('.')[:-3] != template_hash_prefix and os.path.exists(stale_cache):
+                os.remove(stale_cache)
+        with atomic_write(self.method_ids_cache_path, 'wb') as f:
+            pickle.dump((self.method_name_by_id, self.method_name_by_extra_slot, self.prefixes), f,
+                        pickle.HIGHEST_PROTOCOL)
+        self.method_tables_cached = True
+
     def _get_method_ids(self, short_type):
         root = et.parse(list(filter(lambda x: 'result' in os.path.basename(x).lower(), self.jcov_files))[0]).getroot()
         method_ids = {}
         method_slots = {}
         for method_path, method in JcovParser.get_elements_by_path(root, ['package', 'class', 'meth']):
-            package_name, class_name, method_name = list(map(lambda elem: elem.attrib['name'], method_path))
-            if method_name == '<init>':
-                method_name = class_name
-            elif method_name == '<clinit>':
-                method_name = class_name + "_" + "init"
-            method_name = ".".join([package_name, class_name, method_name]) + "({0})".format(
-                Signature(method.attrib['vmsig'], short_type).args)
+            package_name, class_name = list(map(lambda elem: elem.attrib['name'], method_path[:2]))
+            method_name = JcovParser._get_method_name(package_name, class_name, method, short_type)
             if self.instrument_only_methods:
                 method_ids[int(method.attrib['id'])] = method_name
                 method_slots[int(method.attrib['extra_slots'])] = method_name
@@ -101,9 +256,19 @@ class JcovParser(object):
                 method_ids.update(self._get_method_blocks_ids(method, method_name))
         return method_ids, method_slots
 
+    @staticmethod
+    def _get_method_name(package_name, class_name, method, short_type):
+        method_name = method.attrib['name']
+        if method_name == '<init>':
+            method_name = class_name
+        elif method_name == '<clinit>':
+            method_name = class_name + "_" + "init"
+        return ".".join([package_name, class_name, method_name]) + "({0})".format(
+            Signature(method.attrib['vmsig'], short_type).args)
+
     def _get_method_blocks_ids(self, method_et, method_name):
         ids = {}
-        for et in method_et.getchildren():
+        for et in list(method_et):
             id = et.attrib.get("id")
             if id:
                 prefix = et.tag.split("}")[1]
@@ -114,6 +279,84 @@ class JcovParser(object):
         return ids
 
 
+_worker_parser = None
+
+
+def _init_parse_worker(jcov_files, instrument_only_methods, short_type, streaming, template_path):
+    global _worker_parser
+    _worker_parser = JcovParser(None, jcov_files, instrument_only_methods, short_type, streaming, template_path)
+
+
+def _parse_file_in_worker(jcov_file):
+    return _worker_parser._parse_file(jcov_file)
+
+
+def merge_jcov_results(result_files, out_path):
+    # merges the results of grabbers that used the same template and traced disjoint tests: the hits of every element
+    # are concatenated and their counts summed. the results have the elements of the template in the same order, so
+    # they are streamed side by side into the merged file, with one element per line like the grabber output so the
+    # line based parsing of JcovParser works on it as well. returns None when there is no result to merge
+    result_files = list(filter(os.path.exists, result_files))
+    if not result_files:
+        return None
+    with open(out_path, 'w', encoding='UTF-8') as out:
+        out.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        for items in zip_longest(*map(_iter_elements, result_files)):
+            if len(set(map(_get_element_key, items))) != 1:
+                raise ValueError("the results {0} do not share a template".format(result_files))
+            depth, element, has_children = items[0]
+            if element is None:
+                out.write('\t' * depth + '</{0}>\n'.format(has_children))
+                continue
+            attributes = dict(element.attrib)
+            if depth == 0 and element.tag.startswith('{'):
+                attributes['xmlns'] = element.tag[1:].split('}')[0]
+            others = list(filter(lambda other: int(other.get('count', 0)), map(lambda item: item[1].attrib, items[1:])))
+            if attributes.get('id') and others:
+                attributes['count'] = str(sum(map(lambda other: int(other.get('count', 0)), [attributes] + others)))
+                attributes['HitInformation'] = "[" + ",".join(map(
+                    lambda other: other['HitInformation'][1:-1], filter(
+                        lambda other: other.get('HitInformation', '[]') != '[]', [attributes] + others))) + "]"
+            out.write('\t' * depth + '<{0}{1}{2}>\n'.format(element.tag.split('}')[-1], ''.join(map(
+                lambda item: ' {0}={1}'.format(item[0], quoteattr(item[1])), attributes.items())),
+                '' if has_children else '/'))
+    return out_path
+
+
+def _get_element_key(item):
+    # the position of an element of _iter_elements, equal in the results of the same template
+    if item is None:
+        return None
+    depth, element, tag = item
+    if element is None:
+        return depth, None, tag
+    return depth, element.tag, element.attrib.get('id'), element.attrib.get('name')
+
+
+def _iter_elements(xml_path):
+    # streams the elements of an xml file as (depth, element, has children) when they start, and (depth, None, tag)
+    # when an element with children ends. an element is known to have children only once the next one starts, so
+    # every element is yielded one event late, and cleared once it ends
+    pending = None
+    stack = []
+    for event, element in et.iterparse(xml_path, events=('start', 'end')):
+        if event == 'start':
+            if pending is not None:
+                yield len(stack) - 1, pending, True
+            pending = element
+            stack.append(element)
+            continue
+        stack.pop()
+        if pending is element:
+            yield len(stack), element, False
+            pending = None
+        else:
+            yield len(stack), None, element.tag.split('}')[-1]
+        element.clear()
+        if len(stack) == 1:
+            stack[0].clear()
+
+
 def block_to_comps(block):
     splitted = block.split(".")
     package_name = ".".join(splitted[:-3])
@@ -135,23 +378,21 @@ def findPathsNoLC(G,u,n):
 
 
 if __name__ == '__main__':
-    t = list(JcovParser(None, [r"C:\Users\User\Downloads\bug-mining (89)\bug-mining_189\framework\projects\Compress\result_sanity.xml"], True, True).parse(False))[
+    t = list(JcovParser(None, [r"C:\Users\User\Downloads\bug-mining (89)\bug-mining_189\framework\projects\Compress\result_sanity.xml"], True, True, streaming=True).parse_columnar(False))[
         0]
     traces = t.split_to_subtraces()
-    from collections import Counter
     from networkx import DiGraph, single_source_shortest_path_length
     import networkx as nx
     import json
-    e = t.get_call_graph_edges()
-    c = Counter(e)
-    g = DiGraph()
-    g.add_edges_from(e, count=dict(c))
+    nodes, adjacency = t.get_call_graph_csr()
+    g = nx.relabel_nodes(nx.from_scipy_sparse_array(adjacency, create_using=DiGraph, edge_attribute='count'),
+                         dict(enumerate(nodes)))
     possible_pairs = []
     paths = {}
     # allpaths = []
     # for node in g:
     #     allpaths.extend(findPathsNoLC(g, node, 3))
-    for n in g.node:
+    for n in g.nodes:
         if not n.split('.')[-1].startswith('test'):
             continue
         for k, v in single_source_shortest_path_length(g, n).items():
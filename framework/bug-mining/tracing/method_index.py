@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import re
+
+from atomic_file import atomic_write
+
+# comments, string and char literals, blanked before scanning so braces and parentheses in them are ignored
+JAVA_NOISE = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+JAVA_TOKEN = re.compile(r'[A-Za-z_$][A-Za-z0-9_$]*|\.\.\.|[{}()\[\];,<>.=@?&]|\S')
+TYPE_KEYWORDS = ['class', 'interface', 'enum', 'record']
+STATEMENT_KEYWORDS = ['if', 'for', 'while', 'switch', 'catch', 'synchronized', 'return', 'new', 'throw', 'try', 'do',
+                      'else', 'assert', 'super', 'this']
+HUNK_HEADER = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@')
+
+
+def get_blob_sha(content):
+    # the sha git gives to a file with this content
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def tokenize_java(source):
+    # (token, line) pairs of a java source without its comments and literals
+    source = JAVA_NOISE.sub(lambda m: '""' if m.group()[0] in '"\'' else re.sub(r'[^\n]', ' ', m.group()), source)
+    tokens = []
+    line = 1
+    position = 0
+    for match in JAVA_TOKEN.finditer(source):
+        line += source.count('\n', position, match.start())
+        position = match.start()
+        tokens.append((match.group(), line))
+    return tokens
+
+
+def skip_generics(tokens, ind):
+    # the index after the type arguments that start at ind
+    depth = 0
+    while ind < len(tokens):
+        if tokens[ind][0] == '<':
+            depth += 1
+        elif tokens[ind][0] == '>':
+            depth -= 1
+            if depth == 0:
+                return ind + 1
+        ind += 1
+    return ind
+
+
+def find_closing(tokens, ind, opening, closing):
+    depth = 0
+    while ind < len(tokens):
+        if tokens[ind][0] == opening:
+            depth += 1
+        elif tokens[ind][0] == closing:
+            depth -= 1
+            if depth == 0:
+                return ind
+        ind += 1
+    return len(tokens) - 1
+
+
+def get_type_parameters(tokens):
+    # the erasure of every type parameter declared in <...> tokens: its first bound, or Object
+    parameters = {}
+    depth = 0
+    for ind, (token, _) in enumerate(tokens):
+        if token == '<':
+            depth += 1
+        elif token == '>':
+            depth -= 1
+        elif depth == 1 and (ind == 0 or tokens[ind - 1][0] in ['<', ',']) and token != '?':
+            bound = 'Object'
+            if ind + 2 < len(tokens) and tokens[ind + 1][0] == 'extends':
+                end = ind + 2
+                while end + 2 < len(tokens) and tokens[end + 1][0] == '.':
+                    end += 2
+                bound = tokens[end][0]
+            parameters[token] = bound
+    return parameters
+
+
+def get_parameter_type(tokens, type_parameters):
+    # the short jcov type of a declared parameter, generics erased and varargs as arrays
+    tokens = list(filter(lambda t: t[0] != 'final', tokens))
+    while tokens and tokens[0][0] == '@':
+        end = 2
+        while end + 1 < len(tokens) and tokens[end][0] == '.':
+            end += 2
+        if end < len(tokens) and tokens[end][0] == '(':
+            end = find_closing(tokens, end, '(', ')') + 1
+        tokens = tokens[end:]
+    dims = 0
+    names = []
+    ind = 0
+    while ind < len(tokens):
+        token = tokens[ind][0]
+        if token == '<':
+            ind = skip_generics(tokens, ind)
+            continue
+        if token == '[':
+            dims += 1
+        elif token == '...':
+            dims += 1
+        elif token not in [']', '.', '@']:
+            names.append(token)
+        ind += 1
+    # the last name is the parameter name, the one before it is the simple type name
+    type_name = names[-2] if len(names) > 1 else (names[0] if names else 'Object')
+    return type_parameters.get(type_name, type_name) + '[]' * dims
+
+
+def get_initializer_methods(qualified_class, java_class):
+    # the ranges of the initializers of a class as the methods they are compiled into: static initializers, static
+    # fields initializers and enum constants into <clinit>, which jcov names Class_init(), and instance initializers
+    # and fields initializers into every constructor, the default one when the class declares none
+    class_name, _, _, _, _, is_enum, is_inner, initializers, constructors = java_class
+    if not constructors:
+        constructors = ["{0}.{1}({2})".format(qualified_class, class_name, ';'.join(
+            ['String', 'int'] if is_enum else ([class_name.split('$')[-2]] if is_inner else [])))]
+    methods = []
+    for is_static, start, end in initializers:
+        names = ["{0}.{1}_init()".format(qualified_class, class_name)] if is_static else constructors
+        methods.extend(map(lambda name: [name, start, end], names))
+    return methods
+
+
+def scan_java_methods(source):
+    # [name, first line, last line] of every method and constructor of the classes of a java source, named as jcov
+    # names them: package.Outer$Inner.method(short;arg;types), constructors by their class name. the initializers of
+    # a class are reported as the constructors and the Class_init() static initializer they are compiled into
+    tokens = tokenize_java(source)
+    package = ''
+    methods = []
+    # the open classes: [jcov class name, simple name, body depth, type parameters, is interface, is enum, is inner,
+    # initializers as (is static, first line, last line), constructors names]
+    classes = []
+    depth = 0
+    statement_start = 0
+    annotation_line = None
+    ind = 0
+    while ind < len(tokens):
+        token = tokens[ind][0]
+        if token == 'package' and depth == 0:
+            end = ind + 1
+            while end < len(tokens) and tokens[end][0] != ';':
+                end += 1
+            package = ''.join(map(lambda t: t[0], tokens[ind + 1:end]))
+            ind = end + 1
+            statement_start = ind
+            continue
+        in_class_body = bool(classes) and depth == classes[-1][2]
+        if token == '@' and ind + 1 < len(tokens) and tokens[ind + 1][0] != 'interface':
+            # annotations, with their arguments, start the declaration that follows them
+            annotation_line = annotation_line or tokens[ind][1]
+            ind += 2
+            while ind + 1 < len(tokens) and tokens[ind][0] == '.':
+                ind += 2
+            if ind < len(tokens) and tokens[ind][0] == '(':
+                ind = find_closing(tokens, ind, '(', ')') + 1
+            statement_start = ind
+            continue
+        if token in TYPE_KEYWORDS and (ind == 0 or tokens[ind - 1][0] != '.') and ind + 1 < len(tokens) and (
+                depth == 0 or in_class_body):
+            name = tokens[ind + 1][0]
+            body = ind + 2
+            while body < len(tokens) and tokens[body][0] != '{':
+                body += 1
+            modifiers = set(map(lambda t: t[0], tokens[statement_start:ind]))
+            outer = classes[-1] if classes else None
+            is_inner = outer is not None and 'static' not in modifiers and token == 'class' and not outer[4]
+            type_parameters = dict(outer[3]) if outer and is_inner else {}
+            if body > ind + 2:
+                type_parameters.update(get_type_parameters(tokens[ind + 2:body]))
+            classes.append([(outer[0] + '$' if outer else '') + name, name, depth + 1, type_parameters,
+                            token == 'interface', token == 'enum', is_inner, [], []])
+            depth += 1
+            ind = body + 1
+            if token == 'enum':
+                # the enum constants, with their arguments and bodies, up to the first ; of the enum body
+                constants_start = ind
+                while ind < len(tokens) and tokens[ind][0] not in [';', '}']:
+                    if tokens[ind][0] in ['(', '{']:
+                        ind = find_closing(tokens, ind, tokens[ind][0], {'(': ')', '{': '}'}[tokens[ind][0]])
+                    ind += 1
+                if ind > constants_start:
+                    classes[-1][7].append((True, tokens[constants_start][1], tokens[min(ind, len(tokens) - 1)][1]))
+                if ind < len(tokens) and tokens[ind][0] == ';':
+                    ind += 1
+            statement_start = ind
+            annotation_line = None
+            continue
+        if in_class_body and token == '(' and ind > statement_start and tokens[ind - 1][0] not in STATEMENT_KEYWORDS \
+                and '=' not in map(lambda t: t[0], tokens[statement_start:ind]) and re.match(r'[A-Za-z_$]',
+                                                                                            tokens[ind - 1][0]):
+            class_name, simple_name, _, class_type_parameters, _, is_enum, is_inner = classes[-1][:7]
+            name = tokens[ind - 1][0]
+            close = find_closing(tokens, ind, '(', ')')
+            end = close + 1
+            while end < len(tokens) and tokens[end][0] not in ['{', ';']:
+                end += 1
+            if end < len(tokens) and tokens[end][0] == '{':
+                end = find_closing(tokens, end, '{', '}')
+            type_parameters = dict(class_type_parameters)
+            generics_start = next(filter(lambda i: tokens[i][0] == '<', range(statement_start, ind)), None)
+            if generics_start is not None:
+                type_parameters.update(get_type_parameters(tokens[generics_start:skip_generics(tokens, generics_start)]))
+            parameters = []
+            current = []
+            generics = 0
+            for parameter_token in tokens[ind + 1:close]:
+                generics += {'<': 1, '>': -1}.get(parameter_token[0], 0)
+                if parameter_token[0] == ',' and generics == 0:
+                    parameters.append(current)
+                    current = []
+                else:
+                    current.append(parameter_token)
+            if current:
+                parameters.append(current)
+            args = list(map(lambda parameter: get_parameter_type(parameter, type_parameters), parameters))
+            if name == simple_name:
+                name = class_name
+                if is_enum:
+                    args = ['String', 'int'] + args
+                elif is_inner:
+                    args = [class_name.split('$')[-2]] + args
+            method = "{0}.{1}({2})".format('.'.join(filter(None, [package, class_name])), name, ';'.join(args))
+            if name == class_name:
+                classes[-1][8].append(method)
+            methods.append([method, annotation_line or tokens[statement_start][1], tokens[end][1]])
+            ind = end + 1
+            statement_start = ind
+            annotation_line = None
+            continue
+        statement = list(map(lambda t: t[0], tokens[statement_start:ind])) if token in ['{', ';'] else []
+        if token == '{':
+            if in_class_body:
+                # initializer blocks, and the anonymous classes and lambdas of fields initializers that end at their ;
+                close = find_closing(tokens, ind, '{', '}')
+                if '=' not in statement:
+                    classes[-1][7].append(('static' in statement, (annotation_line or tokens[
+                        min(statement_start, ind)][1]), tokens[close][1]))
+                    statement_start = close + 1
+                    annotation_line = None
+                ind = close + 1
+                continue
+            depth += 1
+        elif token == '}':
+            if classes and depth == classes[-1][2]:
+                java_class = classes.pop()
+                methods.extend(get_initializer_methods('.'.join(filter(None, [package, java_class[0]])), java_class))
+            depth -= 1
+            statement_start = ind + 1
+            annotation_line = None
+        elif token == ';':
+            if in_class_body and '=' in statement:
+                classes[-1][7].append(('static' in statement[:statement.index('=')] or classes[-1][4], (
+                        annotation_line or tokens[statement_start][1]), tokens[ind][1]))
+            statement_start = ind + 1
+            annotation_line = None
+        ind += 1
+    return methods
+
+
+def parse_patch(patch_path):
+    # the java files of a unified diff with the lines of their new version that were added or changed, and the
+    # points where lines were only removed, as the pairs of new lines around them
+    files = {}
+    current = None
+    new_line = 0
+    with open(patch_path, errors='replace') as f:
+        for line in f:
+            if line.startswith('+++ '):
+                path = line[4:].strip()
+                current = None
+                if path != '/dev/null' and path.endswith('.java'):
+                    current = files.setdefault(path[2:] if path.startswith('b/') else path, {'lines': set(),
+                                                                                          'removals': set()})
+                continue
+            if line.startswith('diff ') or line.startswith('--- '):
+                continue
+            hunk = HUNK_HEADER.match(line)
+            if hunk:
+                new_line = int(hunk.group(1))
+                continue
+            if current is None:
+                continue
+            if line.startswith('+'):
+                current['lines'].add(new_line)
+                new_line += 1
+            elif line.startswith('-'):
+                current['removals'].add((new_line - 1, new_line))
+            elif line.startswith(' ') or line == '\n':
+                new_line += 1
+    return files
+
+
+class MethodIndexCache(object):
+    # the methods ranges of java files, keyed by their git blob sha, so the files that did not change between bugs
+    # of a project are scanned once
+    VERSION = 2
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _get_path(self, blob_sha):
+        return os.path.join(self.cache_dir, "v{0}".format(MethodIndexCache.VERSION), blob_sha[:2], blob_sha + '.json')
+
+    def get_methods(self, content):
+        blob_sha = get_blob_sha(content)
+        path = self._get_path(blob_sha)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.loads(f.read())
+        methods = scan_java_methods(content.decode('utf-8', errors='replace'))
+        with atomic_write(path) as f:
+            json.dump(methods, f)
+        return methods
+
+
+def get_patch_methods(repo_dir, patch_path, cache):
+    # the methods of the current version of the files in the patch that contain a changed line or a removal point
+    modified = set()
+    for path, changes in parse_patch(patch_path).items():
+        file_path = os.path.join(repo_dir, path)
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path, 'rb') as f:
+            methods = cache.get_methods(f.read())
+        for name, start, end in methods:
+            if any(map(lambda line: start <= line <= end, changes['lines'])) or any(
+                    map(lambda removal: start <= removal[0] and removal[1] <= end, changes['removals'])):
+                modified.add(name)
+    return sorted(modified)
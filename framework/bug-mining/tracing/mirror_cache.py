@@ -0,0 +1,70 @@
+import hashlib
+import os
+import re
+import shlex
+import shutil
+
+
+class MirrorCache(object):
+    # bare mirrors of the projects remotes, keyed by url. checkouts are cloned from the local mirror so a project is
+    # downloaded once and later runs only fetch the new commits, or nothing when the needed commits are present. the
+    # git commands run through the CommandRunner of the stage, with their output in log_path
+    def __init__(self, cache_dir, commands, stage='create_project', log_path=None):
+        self.cache_dir = cache_dir
+        self.commands = commands
+        self.stage = stage
+        self.log_path = log_path
+
+    def get_mirror_path(self, url):
+        name = re.sub('[^A-Za-z0-9_.-]', '_', url.rstrip('/').split('/')[-1])
+        return os.path.join(self.cache_dir, "{0}_{1}".format(name, hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]))
+
+    def git(self, args, cwd=None):
+        # returns the exit code of the git command
+        return self.commands.run(self.stage, shlex.join(["git"] + args), cwd, self.log_path)
+
+    def get_error(self):
+        if not self.log_path or not os.path.exists(self.log_path):
+            return ''
+        with open(self.log_path, errors='replace') as f:
+            return f.read()
+
+    def has_commits(self, url, commits):
+        mirror_path = self.get_mirror_path(url)
+        if not os.path.exists(mirror_path):
+            return False
+        return all(map(lambda commit: self.git(["cat-file", "-e", commit + "^{commit}"], mirror_path) == 0, commits))
+
+    def update(self, url, commits=None):
+        # clones the mirror if missing, otherwise fetches incrementally. the fetch is skipped when all the given
+        # commits are already mirrored, and a failed fetch is tolerated to work offline with an existing mirror
+        mirror_path = self.get_mirror_path(url)
+        if not os.path.exists(mirror_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # the partial mirror of an interrupted clone
+            if os.path.exists(mirror_path + ".tmp"):
+                shutil.rmtree(mirror_path + ".tmp")
+            if self.git(["clone", "--mirror", url, mirror_path + ".tmp"]) != 0:
+                raise RuntimeError("failed to mirror {0}: {1}".format(url, self.get_error()))
+            os.replace(mirror_path + ".tmp", mirror_path)
+            return mirror_path
+        if commits and self.has_commits(url, commits):
+            return mirror_path
+        if self.git(["fetch", "--prune", "origin"], mirror_path) != 0:
+            print("failed to update the mirror of {0}, using the cached one: {1}".format(url, self.get_error()))
+        return mirror_path
+
+    def materialize(self, url, dest, commits=None):
+        # a checkout of url at dest cloned from the mirror, so no network access is needed. the objects are copied
+        # (--dissociate) rather than shared, as a fetch --prune or a gc of the mirror may remove objects it relies on
+        mirror_path = self.update(url, commits)
+        if not os.path.exists(dest):
+            if self.git(["clone", "--reference", mirror_path, "--dissociate", mirror_path, dest]) != 0:
+                raise RuntimeError("failed to clone {0} from {1}: {2}".format(url, mirror_path, self.get_error()))
+        else:
+            self.git(["remote", "set-url", "origin", mirror_path], dest)
+            self.git(["fetch", "--prune", "--tags", "origin"], dest)
+        # keep the real url as a second remote so the checkout still points to the project
+        self.git(["remote", "remove", "upstream"], dest)
+        self.git(["remote", "add", "upstream", url], dest)
+        return dest
@@ -0,0 +1,53 @@
+from collections import deque
+
+import networkx as nx
+
+
+class ReachabilityEngine(object):
+    # answers which nodes reach a set of targets and which nodes are reached from a set of sources with one
+    # multi-source BFS each, optionally over the condensation of the graph strongly connected components
+    def __init__(self, graph, use_condensation=False):
+        self.graph = graph
+        self.use_condensation = use_condensation
+        self.condensation = None
+        if use_condensation:
+            self.condensation = nx.condensation(graph)
+
+    @staticmethod
+    def _bfs(adjacency, sources):
+        visited = set(sources)
+        queue = deque(visited)
+        while queue:
+            for neighbor in adjacency[queue.popleft()]:
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    queue.append(neighbor)
+        return visited
+
+    def _search(self, sources, reverse):
+        sources = list(filter(lambda node: node in self.graph, sources))
+        if not self.use_condensation:
+            return ReachabilityEngine._bfs(self.graph.pred if reverse else self.graph.succ, sources)
+        mapping = self.condensation.graph['mapping']
+        components = ReachabilityEngine._bfs(self.condensation.pred if reverse else self.condensation.succ,
+                                             set(map(lambda node: mapping[node], sources)))
+        members = self.condensation.nodes
+        return set(node for component in components for node in members[component]['members'])
+
+    def reaching(self, targets):
+        # all the nodes with a path to one of the targets, including the targets in the graph
+        return self._search(targets, True)
+
+    def reachable_from(self, sources):
+        # all the nodes reachable from one of the sources, including the sources in the graph
+        return self._search(sources, False)
+
+    def get_relevant_tests(self, tests, bugs):
+        reaching_bugs = self.reaching(bugs)
+        return set(filter(lambda test: test in reaching_bugs, tests))
+
+    def get_relevant_nodes(self, relevant_tests, bugs):
+        relevant_nodes = set(relevant_tests)
+        relevant_nodes.update(set(bugs))
+        relevant_nodes.update(self.reachable_from(relevant_tests))
+        return relevant_nodes
@@ -0,0 +1,116 @@
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import git
+import pandas as pd
+
+from wrapper import Reproducer, TRACE_STAGES
+
+BUG_STAGES = ['get_diffs', 'init_version'] + TRACE_STAGES
+
+
+def mine_bug(project_name, working_dir, ind, worktree_path, logs_dir):
+    # runs the per bug stages of a Reproducer on its own worktree and returns the bug status with the stages timings.
+    # the stages run through the StageRunner of the bug, so a failed bug resumes at its first stage that did not finish
+    status = {'project': project_name, 'bug_id': ind, 'worktree': worktree_path, 'status': 'done', 'stage': None,
+              'error': None, 'timings': {}, 'started': time.time()}
+    os.makedirs(logs_dir, exist_ok=True)
+    reproducer = Reproducer(project_name, working_dir, ind, repo_path=worktree_path, logs_dir=logs_dir)
+    for stage in BUG_STAGES:
+        status['stage'] = stage
+        start = time.time()
+        try:
+            reproducer.run_stages([stage])
+        except Exception:
+            status['status'] = 'failed'
+            status['error'] = traceback.format_exc()
+            break
+        finally:
+            status['timings'][stage] = time.time() - start
+    status['finished'] = time.time()
+    return status
+
+
+class MiningScheduler(object):
+    def __init__(self, project_name, working_dir, workers=None):
+        self.project_name = project_name
+        self.working_dir = working_dir
+        self.workers = workers or os.cpu_count()
+        self.reproducer = Reproducer(project_name, working_dir, '0')
+        self.worktrees_dir = os.path.join(self.reproducer.repo_dir, 'worktrees', project_name)
+        self.logs_dir = os.path.join(self.reproducer.work_dir, 'logs', project_name)
+        self.status_path = os.path.join(self.reproducer.work_dir, f"mining_status_{project_name}.jsonl")
+
+    def prepare(self):
+        # the clone and the active bugs are shared by all the bugs of the project
+        self.reproducer.create_project()
+        self.reproducer.extract_issues()
+
+    def get_bug_ids(self, first=None, last=None):
+        bug_ids = sorted(set(pd.read_csv(Reproducer.ACTIVE_BUGS)['bug.id'].astype(int).tolist()))
+        return list(filter(lambda bug_id: (first is None or bug_id >= first) and (last is None or bug_id <= last),
+                           bug_ids))
+
+    def get_bug_logs_dir(self, bug_id):
+        return os.path.join(self.logs_dir, str(bug_id))
+
+    def create_worktree(self, bug_id):
+        # a detached worktree without checkout, Reproducer.init_version checks out the bug commit. the stages that
+        # finished on a previous worktree of the bug are forgotten, as a new worktree is neither compiled nor patched
+        worktree_path = os.path.join(self.worktrees_dir, str(bug_id))
+        if not os.path.exists(worktree_path):
+            Reproducer(self.project_name, self.working_dir, str(bug_id), repo_path=worktree_path,
+                       logs_dir=self.get_bug_logs_dir(bug_id)).reset_stages()
+            repo = git.Repo(self.reproducer.repo_path)
+            repo.git.worktree('prune')
+            repo.git.worktree('add', '--detach', '--no-checkout', worktree_path, 'HEAD')
+        return worktree_path
+
+    def remove_worktree(self, bug_id):
+        # the traces and logs of the bug are kept outside of its worktree
+        repo = git.Repo(self.reproducer.repo_path)
+        try:
+            repo.git.worktree('remove', '--force', os.path.join(self.worktrees_dir, str(bug_id)))
+        except git.GitCommandError as e:
+            print(f"failed to remove the worktree of bug {bug_id}: {e}")
+        repo.git.worktree('prune')
+
+    def record(self, status):
+        with open(self.status_path, 'a') as f:
+            f.write(json.dumps(status) + '\n')
+
+    def run(self, first=None, last=None):
+        self.prepare()
+        os.makedirs(self.worktrees_dir, exist_ok=True)
+        statuses = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            for bug_id in self.get_bug_ids(first, last):
+                futures[executor.submit(mine_bug, self.project_name, self.working_dir, str(bug_id),
+                                        self.create_worktree(bug_id), self.get_bug_logs_dir(bug_id))] = bug_id
+            for future in as_completed(futures):
+                try:
+                    status = future.result()
+                except Exception:
+                    status = {'project': self.project_name, 'bug_id': str(futures[future]), 'status': 'failed',
+                              'error': traceback.format_exc()}
+                # the worktrees of the failed bugs are kept, so their next run resumes them
+                if status['status'] == 'done':
+                    self.remove_worktree(futures[future])
+                print(f"bug {status['bug_id']}: {status['status']}")
+                self.record(status)
+                statuses.append(status)
+        return statuses
+
+
+if __name__ == '__main__':
+    project_name = sys.argv[1]
+    working_dir = sys.argv[2]
+    first = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    last = int(sys.argv[4]) if len(sys.argv) > 4 else first
+    workers = int(sys.argv[5]) if len(sys.argv) > 5 else None
+    MiningScheduler(project_name, working_dir, workers).run(first, last)
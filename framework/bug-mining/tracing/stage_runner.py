@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import time
+import traceback
+
+
+class Stage(object):
+    # a named step of the pipeline with the files it reads and writes and the values it depends on. the inputs,
+    # outputs and params may be functions, for values that are known only when the stage runs
+    def __init__(self, name, action, inputs=None, outputs=None, params=None):
+        self.name = name
+        self.action = action
+        self.inputs = inputs or []
+        self.outputs = outputs or []
+        self.params = params or {}
+
+    @staticmethod
+    def _get(value):
+        return value() if callable(value) else value
+
+    def get_inputs(self):
+        return Stage._get(self.inputs)
+
+    def get_outputs(self):
+        return Stage._get(self.outputs)
+
+    def get_params(self):
+        return Stage._get(self.params)
+
+
+class StageRunner(object):
+    # runs stages in order and records in a manifest the key of every stage that finished: a hash of its params, the
+    # content of its input files and the key of the stage before it. a stage is skipped when its key is unchanged and
+    # its outputs exist, so an interrupted or failed run resumes at the first stage that did not finish. directories
+    # are compared by existence only, their content belongs to the stages that run in them
+    def __init__(self, manifest_path, monitor=None):
+        self.manifest_path = manifest_path
+        # records every stage that runs, a CommandRunner
+        self.monitor = monitor
+        self.manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.loads(f.read())
+
+    def save(self):
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    @staticmethod
+    def get_file_digest(path):
+        if not os.path.exists(path):
+            return 'missing'
+        if os.path.isdir(path):
+            return 'directory'
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def get_key(self, stage, previous_key):
+        params = stage.get_params()
+        inputs = list(map(lambda path: (path, StageRunner.get_file_digest(path)), stage.get_inputs()))
+        return hashlib.sha1(json.dumps([params, inputs, previous_key], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def is_done(self, stage, key):
+        record = self.manifest.get(stage.name)
+        return bool(record) and record['status'] == 'done' and record['key'] == key and all(
+            map(os.path.exists, stage.get_outputs()))
+
+    def run(self, stages, names=None, force=False):
+        # runs the stages in names (all by default) that are not done. the stages not in names are only used to
+        # chain the keys
+        previous_key = ''
+        for stage in stages:
+            if names is not None and stage.name not in names:
+                previous_key = self.manifest.get(stage.name, {}).get('key', '')
+                continue
+            key = self.get_key(stage, previous_key)
+            previous_key = key
+            if not force and self.is_done(stage, key):
+                print(f"stage {stage.name} is up to date")
+                continue
+            record = {'status': 'running', 'key': key, 'started': time.time()}
+            self.manifest[stage.name] = record
+            self.save()
+            try:
+                if self.monitor:
+                    with self.monitor.span(stage.name):
+                        stage.action()
+                else:
+                    stage.action()
+            except Exception:
+                record.update({'status': 'failed', 'error': traceback.format_exc(), 'finished': time.time()})
+                self.save()
+                raise
+            record.update({'status': 'done', 'finished': time.time()})
+            self.save()
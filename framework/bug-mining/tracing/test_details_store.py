@@ -0,0 +1,101 @@
+import os
+import shutil
+
+import numpy as np
+
+
+class TestDetailsStore(object):
+    # binary form of the test details written by Tracer.stop_grabber: an interned components table and, per test,
+    # the ids of its components and its outcome. the arrays are memory mapped so only the parts read are loaded
+    COMPONENTS = 'components.txt'
+    TESTS = 'tests.txt'
+    OUTCOMES = 'outcomes.npy'
+    OFFSETS = 'offsets.npy'
+    IDS = 'ids.npy'
+
+    def __init__(self, path):
+        self.path = path
+        self._components = None
+        self._component_ids = None
+        self._tests = None
+        self._test_ids = None
+        self._arrays = {}
+
+    @staticmethod
+    def write(path, tests_details):
+        # tests_details is the list of (test name, components, outcome) dumped to test_details_<type>.json
+        component_ids = {}
+        offsets = [0]
+        ids = []
+        for _, components, _ in tests_details:
+            ids.extend(map(lambda component: component_ids.setdefault(component, len(component_ids)), components))
+            offsets.append(len(ids))
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        TestDetailsStore._write_names(os.path.join(tmp_path, TestDetailsStore.COMPONENTS), component_ids)
+        TestDetailsStore._write_names(os.path.join(tmp_path, TestDetailsStore.TESTS),
+                                      list(map(lambda details: details[0], tests_details)))
+        np.save(os.path.join(tmp_path, TestDetailsStore.OUTCOMES),
+                np.array(list(map(lambda details: details[2], tests_details)), dtype=np.int8))
+        np.save(os.path.join(tmp_path, TestDetailsStore.OFFSETS), np.array(offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_path, TestDetailsStore.IDS), np.array(ids, dtype=np.int32))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _write_names(path, names):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(map(lambda name: name + '\n', names))
+
+    def _read_names(self, name):
+        with open(os.path.join(self.path, name), encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def _get_array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, name), mmap_mode='r')
+        return self._arrays[name]
+
+    @property
+    def components(self):
+        if self._components is None:
+            self._components = self._read_names(TestDetailsStore.COMPONENTS)
+        return self._components
+
+    @property
+    def tests(self):
+        if self._tests is None:
+            self._tests = self._read_names(TestDetailsStore.TESTS)
+        return self._tests
+
+    def get_component_id(self, component):
+        if self._component_ids is None:
+            self._component_ids = dict(map(lambda item: (item[1], item[0]), enumerate(self.components)))
+        return self._component_ids[component]
+
+    def get_test_id(self, test_name):
+        if self._test_ids is None:
+            self._test_ids = dict(map(lambda item: (item[1], item[0]), enumerate(self.tests)))
+        return self._test_ids[test_name]
+
+    def get_test_component_ids(self, test_name):
+        offsets = self._get_array(TestDetailsStore.OFFSETS)
+        test_id = self.get_test_id(test_name)
+        return self._get_array(TestDetailsStore.IDS)[offsets[test_id]:offsets[test_id + 1]]
+
+    def get_test_components(self, test_name):
+        return list(map(lambda component_id: self.components[component_id],
+                        self.get_test_component_ids(test_name).tolist()))
+
+    def get_outcome(self, test_name):
+        return int(self._get_array(TestDetailsStore.OUTCOMES)[self.get_test_id(test_name)])
+
+    def get_component_tests(self, component):
+        positions = np.flatnonzero(self._get_array(TestDetailsStore.IDS) == self.get_component_id(component))
+        test_ids = np.searchsorted(self._get_array(TestDetailsStore.OFFSETS), positions, side='right') - 1
+        return list(map(lambda test_id: self.tests[test_id], np.unique(test_ids).tolist()))
+
+    def to_tests_details(self):
+        return list(map(lambda test_name: (test_name, self.get_test_components(test_name),
+                                           self.get_outcome(test_name)), self.tests))
@@ -0,0 +1,21 @@
+import os
+
+
+class TestFileIndex(object):
+    # the .java and .class test files of a project by their lowercased simple class name, built in one walk. inner and
+    # anonymous classes (Outer$Inner.class) are indexed under their outer class
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.paths = {}
+        for root, dirs, files in os.walk(root_dir):
+            dirs[:] = list(filter(lambda d: d != '.git', dirs))
+            for f in filter(lambda x: (x.endswith('.java') or x.endswith('.class')) and 'test' in x.lower(), files):
+                self.paths.setdefault(TestFileIndex.get_key(f), []).append(os.path.join(root, f))
+
+    @staticmethod
+    def get_key(name):
+        # the lowercased simple class name of a file name or of an ant pattern such as **/FooTest.java
+        return os.path.splitext(os.path.basename(name))[0].split('$')[0].lower()
+
+    def get_paths(self, names):
+        return sorted(set(path for key in set(map(TestFileIndex.get_key, names)) for path in self.paths.get(key, [])))
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+# the tracing modules import each other as top level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+# two tests of FooTest, testB runs twice, and the methods of Foo they call. the hits are [count, previous slot, parent,
+# test slot, test parent, test previous], the hit of baz belongs to no test
+RESULT = """<?xml version="1.0" encoding="UTF-8"?>
+<coverage xmlns="http://java.sun.com/jcov/namespace" version="3.0">
+<head>
+<property name="a" value="b"/>
+</head>
+<package name="org.p">
+	<class name="FooTest" checksum="1">
+		<meth name="testA" vmsig="()V" flags="public" id="2" extra_slots="3" count="1" HitInformation="[[1,0,0,-1,-1,-1]]"/>
+		<meth name="testB" vmsig="()V" flags="public" id="4" extra_slots="5" count="2" HitInformation="[[1,0,0,-1,-1,-1],[1,3,0,-1,-1,-1]]"/>
+	</class>
+	<class name="Foo" checksum="1">
+		<meth name="&lt;init&gt;" vmsig="(I)V" flags="public" id="6" extra_slots="7" count="2" HitInformation="[[1,3,3,3,0,0],[1,5,5,5,0,0]]"/>
+		<meth name="bar" vmsig="(Ljava/lang/String;[J)I" flags="public" id="8" extra_slots="9" count="3" HitInformation="[[2,7,7,3,0,0],[1,7,7,5,0,3]]"/>
+		<meth name="baz" vmsig="()V" flags="public" id="10" extra_slots="11" count="1" HitInformation="[[1,9,9,13,0,0]]"/>
+		<meth name="unused" vmsig="()V" flags="public" id="12" extra_slots="13" count="0" HitInformation="[]"/>
+	</class>
+</package>
+</coverage>
+"""
+
+# the same tests traced by blocks, the blocks of a method are the elements with an id under its meth element
+BLOCKS_RESULT = """<?xml version="1.0" encoding="UTF-8"?>
+<coverage xmlns="http://java.sun.com/jcov/namespace" version="3.0">
+<head>
+<property name="a" value="b"/>
+</head>
+<package name="org.p">
+	<class name="FooTest" checksum="1">
+		<meth name="testA" vmsig="()V" flags="public">
+			<bl s="0" e="4">
+				<methenter s="0" e="2" id="2" extra_slots="3" count="1" HitInformation="[[1,0,0,-1,-1,-1]]"/>
+				<exit s="3" e="4" id="20" extra_slots="-1" count="1" HitInformation="[[1,2,0,-1,-1,-1]]"/>
+			</bl>
+		</meth>
+	</class>
+	<class name="Foo" checksum="1">
+		<meth name="bar" vmsig="(Ljava/lang/String;[J)I" flags="public">
+			<bl s="0" e="9">
+				<methenter s="0" e="3" id="8" extra_slots="9" count="2" HitInformation="[[2,2,2,3,0,0]]"/>
+				<bl s="4" e="6">
+					<branch s="4" e="6" id="21" extra_slots="-1" count="1" HitInformation="[[1,8,2,3,0,0]]"/>
+				</bl>
+				<exit s="7" e="9" id="22" extra_slots="-1" count="0" HitInformation="[]"/>
+			</bl>
+		</meth>
+	</class>
+</package>
+</coverage>
+"""
+
+
+@pytest.fixture
+def result_path(tmp_path):
+    path = tmp_path / 'result_full.xml'
+    path.write_text(RESULT)
+    return str(path)
+
+
+@pytest.fixture
+def blocks_result_path(tmp_path):
+    path = tmp_path / 'result_blocks.xml'
+    path.write_text(BLOCKS_RESULT)
+    return str(path)
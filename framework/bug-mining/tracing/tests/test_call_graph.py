@@ -0,0 +1,54 @@
+import struct
+
+import pytest
+
+import call_graph
+from call_graph import CallGraphCache, get_call_graph_edges, read_class_name
+
+JAVACG_LINES = ["C:org.a.A org.a.B\n", "M:org.a.A:foo() (M)org.a.B:bar(int)\n", "C:org.a.A java.lang.Object\n"]
+
+
+def get_class_data(class_name):
+    # a class file with only the constant pool entries of its name: #1 the utf8 name and #2 the class
+    name = class_name.replace('.', '/').encode('utf-8')
+    return (struct.pack('>IHHH', 0xCAFEBABE, 0, 52, 3) + struct.pack('>BH', 1, len(name)) + name +
+            struct.pack('>BH', 7, 1) + struct.pack('>HHH', 0x21, 2, 0))
+
+
+def test_read_class_name():
+    assert read_class_name(get_class_data('org.a.A$Inner')) == 'org.a.A$Inner'
+
+
+def test_edges_are_cached_by_class(tmp_path, monkeypatch):
+    monkeypatch.setattr(call_graph, 'iter_javacg_lines', lambda call_graph_jar_path, jar_path: iter(JAVACG_LINES))
+    cache = CallGraphCache(str(tmp_path))
+    class_files = [('org/a/A.class', get_class_data('org.a.A')), ('broken.class', b'\xca\xfe')]
+    edges = get_call_graph_edges('javacg.jar', class_files, cache)
+    assert edges == {'classes': {('org.a.A', 'org.a.B')}, 'methods': {('org.a.A.foo', 'org.a.B.bar')}}
+    assert cache.get(CallGraphCache.get_digest(class_files[0][1])) == {'classes': [('org.a.A', 'org.a.B')],
+                                                                        'methods': [('org.a.A.foo', 'org.a.B.bar')]}
+    # the class whose name could not be read is not cached with no edges
+    assert cache.get(CallGraphCache.get_digest(b'\xca\xfe')) is None
+
+
+def test_failed_javacg_caches_nothing(tmp_path, monkeypatch):
+    def iter_failed_javacg_lines(call_graph_jar_path, jar_path):
+        yield JAVACG_LINES[0]
+        raise RuntimeError("javacg failed with exit code 1 on " + jar_path)
+    monkeypatch.setattr(call_graph, 'iter_javacg_lines', iter_failed_javacg_lines)
+    cache = CallGraphCache(str(tmp_path))
+    class_data = get_class_data('org.a.A')
+    with pytest.raises(RuntimeError):
+        get_call_graph_edges('javacg.jar', [('org/a/A.class', class_data)], cache)
+    assert cache.get(CallGraphCache.get_digest(class_data)) is None
+
+
+def test_javacg_exit_code_is_checked(monkeypatch):
+    # javacg is replaced by a command that prints a line and fails
+    popen = call_graph.Popen
+    monkeypatch.setattr(call_graph, 'Popen', lambda args, **kwargs: popen(
+        ['sh', '-c', 'echo "C:org.a.A org.a.B"; exit 3'], **kwargs))
+    lines = call_graph.iter_javacg_lines('javacg.jar', 'classes.jar')
+    assert next(lines) == "C:org.a.A org.a.B\n"
+    with pytest.raises(RuntimeError):
+        next(lines)
@@ -0,0 +1,22 @@
+from columnar_trace import ColumnarTrace, MethodTable
+from jcov_parser import JcovParser
+
+QUERIES = ['get_trace', 'get_execution_edges', 'get_call_graph_edges', 'get_execution_edges_num',
+           'get_call_graph_edges_num']
+
+
+def get_subtraces(traces):
+    return dict(map(lambda item: (item[0], dict(map(lambda query: (query, sorted(getattr(item[1], query)())),
+                                                     QUERIES))), traces.items()))
+
+
+def test_split_to_subtraces_matches_trace(result_path):
+    parser = JcovParser(None, [result_path], True, True)
+    trace = list(parser.parse())[0]
+    expected = get_subtraces(trace.split_to_subtraces())
+    assert set(expected) == {'org.p.FooTest.testA()', 'org.p.FooTest.testB()', 'unknown_13_0_0'}
+    streamed = list(JcovParser(None, [result_path], True, True, streaming=True).parse_columnar())[0]
+    converted = ColumnarTrace.from_trace(trace, MethodTable.from_dicts(parser.method_name_by_id,
+                                                                       parser.method_name_by_extra_slot))
+    assert get_subtraces(streamed.split_to_subtraces()) == expected
+    assert get_subtraces(converted.split_to_subtraces()) == expected
@@ -0,0 +1,57 @@
+import pytest
+
+from compile_repair import CompileRepair, Diagnostic, parse_javac_diagnostics
+
+
+@pytest.mark.parametrize('line, diagnostic', [
+    ("    [javac] /repo/src/test/org/a/ATest.java:12: error: cannot find symbol",
+     Diagnostic('/repo/src/test/org/a/ATest.java', 12, 'error', 'cannot find symbol')),
+    # old javac prints no error: prefix
+    ("    [javac] /repo/src/test/org/a/ATest.java:7: incompatible types",
+     Diagnostic('/repo/src/test/org/a/ATest.java', 7, 'error', 'incompatible types')),
+    ("    [javac] /repo/src/main/org/a/A.java:3: warning: [unchecked] unchecked call",
+     Diagnostic('/repo/src/main/org/a/A.java', 3, 'warning', '[unchecked] unchecked call')),
+    ("    [javac] C:\\repo\\src\\test\\ATest.java:4: error: ';' expected",
+     Diagnostic('C:\\repo\\src\\test\\ATest.java', 4, 'error', "';' expected")),
+    ("[ERROR] /repo/src/test/java/org/a/ATest.java:[12,5] cannot find symbol",
+     Diagnostic('/repo/src/test/java/org/a/ATest.java', 12, 'error', 'cannot find symbol')),
+    ("[ERROR] /repo/src/test/java/org/a/ATest.java:[9] method does not override",
+     Diagnostic('/repo/src/test/java/org/a/ATest.java', 9, 'error', 'method does not override')),
+    ("[WARNING] /repo/src/main/java/org/a/A.java:[20,13] deprecated API",
+     Diagnostic('/repo/src/main/java/org/a/A.java', 20, 'warning', 'deprecated API')),
+])
+def test_parse_javac_diagnostics(line, diagnostic):
+    assert parse_javac_diagnostics([line]) == [diagnostic]
+
+
+@pytest.mark.parametrize('line', [
+    "    [javac] Note: /repo/src/test/org/a/ATest.java uses unchecked or unsafe operations.",
+    "    [javac] Note: Recompile with -Xlint:unchecked for details.",
+    "    [javac] Compiling 3 source files to /repo/target/test-classes",
+    "    [javac] 1 error",
+    "[INFO] BUILD FAILURE",
+])
+def test_parse_javac_diagnostics_ignores_other_lines(line):
+    assert parse_javac_diagnostics([line]) == []
+
+
+def test_repair_removes_only_the_failing_tests(tmp_path):
+    (tmp_path / 'src' / 'test').mkdir(parents=True)
+    (tmp_path / 'src' / 'main').mkdir(parents=True)
+    failing = tmp_path / 'src' / 'test' / 'ATest.java'
+    warned = tmp_path / 'src' / 'test' / 'BTest.java'
+    for path in [failing, warned]:
+        path.write_text('class A {}')
+    log_path = tmp_path / 'compile.log'
+    logs = [["    [javac] {0}:1: error: cannot find symbol".format(failing),
+             "    [javac] {0}:1: warning: [deprecation] old".format(warned),
+             "    [javac] Note: {0} uses unchecked or unsafe operations.".format(warned)], []]
+
+    def compile_tests():
+        lines = logs.pop(0)
+        log_path.write_text('\n'.join(lines) + '\n')
+        return 1 if lines else 0
+    summary = CompileRepair(str(tmp_path), compile_tests, str(log_path)).run()
+    assert summary['status'] == 'clean'
+    assert summary['removed'] == ['src/test/ATest.java']
+    assert not failing.exists() and warned.exists()
@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+from conftest import RESULT
+from jcov_parser import JcovParser, merge_jcov_results
+
+
+def get_hits(trace):
+    # the traced elements of a trace with their hits and the edges of every hit
+    return sorted(map(lambda element: (element.id, element.method_name, element.count, list(map(
+        lambda hit: (hit.count, hit.previous_slot, hit.parent, hit.test_slot, hit.test_parent, hit.test_previous,
+                     hit.execution_edge, hit.call_graph_edge), element.hits_information))), trace.trace.values()))
+
+
+def get_traces_hits(traces):
+    return dict(map(lambda trace: (trace.test_name, get_hits(trace)), traces))
+
+
+def test_pool_parsing_matches_sequential_parsing(tmp_path):
+    # a result file per test in a directory, the method tables are cached next to the template
+    results_dir = tmp_path / 'results'
+    results_dir.mkdir()
+    (results_dir / 'result_a.xml').write_text(RESULT)
+    (results_dir / 'result_b.xml').write_text(RESULT.replace(
+        'count="1" HitInformation="[[1,9,9,13,0,0]]"', 'count="2" HitInformation="[[1,9,9,13,0,0],[1,9,9,3,0,0]]"'))
+    template = tmp_path / 'template_full.xml'
+    template.write_text(RESULT)
+    for streaming in [False, True]:
+        sequential = get_traces_hits(JcovParser(str(results_dir), None, True, True, streaming=streaming,
+                                                template_path=str(template)).parse())
+        assert sorted(sequential) == ['result_a', 'result_b']
+        assert sequential['result_a'] != sequential['result_b']
+        pooled = get_traces_hits(JcovParser(str(results_dir), None, True, True, streaming=streaming,
+                                            template_path=str(template)).parse(workers=2))
+        assert pooled == sequential
+    # without a template every worker builds the method tables itself
+    assert get_traces_hits(JcovParser(str(results_dir), None, True, True).parse(workers=2)) == sequential
+
+
+def test_merge_jcov_results(tmp_path, result_path):
+    # the second fork ran baz twice for another test, and nothing else
+    fork = re.sub('count="[0-9]+" HitInformation="[^"]*"', 'count="0" HitInformation="[]"', RESULT).replace(
+        'id="10" extra_slots="11" count="0" HitInformation="[]"',
+        'id="10" extra_slots="11" count="2" HitInformation="[[2,9,9,15,0,0]]"')
+    fork_path = tmp_path / 'result_fork_1.xml'
+    fork_path.write_text(fork)
+    merged_path = str(tmp_path / 'result_merged.xml')
+    assert merge_jcov_results([result_path, str(fork_path), str(tmp_path / 'missing.xml')], merged_path) == merged_path
+    expected = get_hits(list(JcovParser(None, [result_path], True, True).parse())[0])
+    baz = list(filter(lambda element: element[0] == 10, expected))[0]
+    expected[expected.index(baz)] = (10, baz[1], 3, baz[3] + [(2, 9, 9, 15, 0, 0, baz[3][0][6], baz[3][0][7])])
+    for streaming in [False, True]:
+        assert get_hits(list(JcovParser(None, [merged_path], True, True, streaming=streaming).parse())[0]) == expected
+
+
+def test_merge_jcov_results_of_other_templates(tmp_path, result_path):
+    other = tmp_path / 'result_other.xml'
+    other.write_text(RESULT.replace('id="12"', 'id="14"'))
+    with pytest.raises(ValueError):
+        merge_jcov_results([result_path, str(other)], str(tmp_path / 'result_merged.xml'))
+    assert merge_jcov_results([str(tmp_path / 'missing.xml')], str(tmp_path / 'result_merged.xml')) is None
+
+
+@pytest.mark.parametrize('instrument_only_methods', [True, False])
+def test_streaming_matches_parse(tmp_path, result_path, blocks_result_path, instrument_only_methods):
+    path = result_path if instrument_only_methods else blocks_result_path
+    expected = get_hits(list(JcovParser(None, [path], instrument_only_methods, True).parse())[0])
+    assert expected
+    assert get_hits(list(JcovParser(None, [path], instrument_only_methods, True, streaming=True).parse())[0]) == expected
+    # the first streaming parse saves the method tables of the template, the next ones load them
+    template = tmp_path / 'template.xml'
+    template.write_text(open(path).read())
+    for cached in [False, True]:
+        parser = JcovParser(None, [path], instrument_only_methods, True, streaming=True, template_path=str(template))
+        assert parser.method_tables_cached == cached
+        assert get_hits(list(parser.parse())[0]) == expected
+    assert get_hits(list(JcovParser(None, [path], instrument_only_methods, True,
+                                    template_path=str(template)).parse())[0]) == expected
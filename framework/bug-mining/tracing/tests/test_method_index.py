@@ -0,0 +1,160 @@
+import os
+import subprocess
+
+from method_index import MethodIndexCache, get_blob_sha, get_patch_methods, parse_patch, scan_java_methods
+
+SOURCE = """package org.x;
+
+import java.util.*;
+
+/** doc { ( */
+public class Foo<T extends Comparable<T>> {
+    private String s = "a { (";
+    static int count;
+
+    static {
+        count = 1;
+    }
+
+    {
+        s = "b";
+    }
+
+    public Foo(int a) {
+        this.a = a;
+    }
+
+    @SuppressWarnings(value = "unchecked")
+    public <K, V extends List<K>> Map<K, V> bar(final Map<K, V> m, T t, String... xs) throws Exception {
+        if (m == null) { return null; }
+        return m;
+    }
+
+    class Inner {
+        Inner(String x) { }
+        void run() {
+            Object o = new Object() { public void hidden() {} };
+        }
+    }
+
+    static class Nested<E extends Number> {
+        Nested(E e, E[] es) {}
+    }
+
+    enum Color {
+        RED("r") { void f() {} }, GREEN("g");
+        Color(String c) {}
+        char code() { return '}'; }
+    }
+
+    interface Api {
+        int LIMIT = 3;
+        void call(Inner i);
+    }
+}
+"""
+
+PATCH = """diff --git a/src/org/x/Foo.java b/src/org/x/Foo.java
+--- a/src/org/x/Foo.java
++++ b/src/org/x/Foo.java
+@@ -9,7 +9,7 @@ public class Foo<T extends Comparable<T>> {
+
+     static {
+-        count = 0;
++        count = 1;
+     }
+
+     {
+@@ -22,7 +22,6 @@ public class Foo<T extends Comparable<T>> {
+     @SuppressWarnings(value = "unchecked")
+     public <K, V extends List<K>> Map<K, V> bar(final Map<K, V> m, T t, String... xs) throws Exception {
+         if (m == null) { return null; }
+-        m.clear();
+         return m;
+     }
+
+@@ -41,5 +40,5 @@ public class Foo<T extends Comparable<T>> {
+         RED("r") { void f() {} }, GREEN("g");
+         Color(String c) {}
+-        char code() { return 'x'; }
++        char code() { return '}'; }
+     }
+
+"""
+
+
+def get_ranges(source):
+    ranges = {}
+    for name, start, end in scan_java_methods(source):
+        ranges.setdefault(name, []).append((start, end))
+    return ranges
+
+
+def test_methods_and_constructors():
+    ranges = get_ranges(SOURCE)
+    assert ranges['org.x.Foo.Foo(int)'][0] == (18, 20)
+    assert ranges['org.x.Foo.bar(Map;Comparable;String[])'] == [(22, 26)]
+    assert ranges['org.x.Foo$Color.code()'] == [(42, 42)]
+    assert ranges['org.x.Foo$Api.call(Inner)'] == [(47, 47)]
+    assert not any(map(lambda name: 'hidden' in name or '.f()' in name, ranges))
+
+
+def test_nested_inner_enum_and_generic_constructors():
+    ranges = get_ranges(SOURCE)
+    # inner classes constructors take their outer instance first, enum constructors the name and ordinal
+    assert ranges['org.x.Foo$Inner.Foo$Inner(Foo;String)'] == [(29, 29)]
+    assert ranges['org.x.Foo$Nested.Foo$Nested(Number;Number[])'] == [(36, 36)]
+    assert ranges['org.x.Foo$Color.Foo$Color(String;int;String)'] == [(41, 41)]
+
+
+def test_initializers():
+    ranges = get_ranges(SOURCE)
+    # the static block and the enum constants are in the static initializer, the instance initializers in the
+    # constructors, and the constant of the interface in its static initializer
+    assert ranges['org.x.Foo.Foo_init()'] == [(10, 12)]
+    assert sorted(ranges['org.x.Foo.Foo(int)']) == [(7, 7), (14, 16), (18, 20)]
+    assert ranges['org.x.Foo$Color.Foo$Color_init()'] == [(40, 40)]
+    assert ranges['org.x.Foo$Api.Foo$Api_init()'] == [(46, 46)]
+
+
+def test_default_constructor_initializers():
+    ranges = get_ranges("class A { int x = 1; class B { int y = 2; } enum E { X; int z = 3; } }")
+    assert ranges['A.A()'] == [(1, 1)]
+    assert ranges['A$B.A$B(A)'] == [(1, 1)]
+    assert ranges['A$E.A$E(String;int)'] == [(1, 1)]
+    assert ranges['A$E.A$E_init()'] == [(1, 1)]
+
+
+def test_parse_patch(tmp_path):
+    patch = tmp_path / 'src.patch'
+    patch.write_text(PATCH)
+    changes = parse_patch(str(patch))
+    assert list(changes) == ['src/org/x/Foo.java']
+    assert changes['src/org/x/Foo.java']['lines'] == {11, 42}
+    assert changes['src/org/x/Foo.java']['removals'] == {(10, 11), (24, 25), (41, 42)}
+
+
+def test_get_patch_methods(tmp_path):
+    source_path = tmp_path / 'repo' / 'src' / 'org' / 'x' / 'Foo.java'
+    source_path.parent.mkdir(parents=True)
+    source_path.write_text(SOURCE)
+    patch = tmp_path / 'src.patch'
+    patch.write_text(PATCH)
+    cache = MethodIndexCache(str(tmp_path / 'cache'))
+    expected = ['org.x.Foo$Color.code()', 'org.x.Foo.Foo_init()', 'org.x.Foo.bar(Map;Comparable;String[])']
+    assert get_patch_methods(str(tmp_path / 'repo'), str(patch), cache) == expected
+    # the second lookup reads the scan of the unchanged file from the cache
+    blob_sha = get_blob_sha(SOURCE.encode('utf-8'))
+    assert os.path.exists(os.path.join(str(tmp_path / 'cache'), "v{0}".format(MethodIndexCache.VERSION),
+                                       blob_sha[:2], blob_sha + '.json'))
+    assert get_patch_methods(str(tmp_path / 'repo'), str(patch), cache) == expected
+
+
+def test_blob_sha_is_git_blob_sha(tmp_path):
+    path = tmp_path / 'Foo.java'
+    path.write_text(SOURCE)
+    try:
+        git_sha = subprocess.run(['git', 'hash-object', str(path)], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return
+    assert get_blob_sha(SOURCE.encode('utf-8')) == git_sha
@@ -0,0 +1,56 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from command_runner import CommandRunner
+from mirror_cache import MirrorCache
+
+
+def git(args, cwd):
+    return subprocess.run(['git', '-c', 'user.email=a@b.c', '-c', 'user.name=a'] + args, cwd=cwd, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def remote(tmp_path):
+    # a local bare repository stands in for the project remote
+    work = tmp_path / 'work'
+    work.mkdir()
+    git(['init', '-q'], str(work))
+    (work / 'A.java').write_text('class A {}\n')
+    git(['add', 'A.java'], str(work))
+    git(['commit', '-q', '-m', 'a'], str(work))
+    git(['clone', '-q', '--bare', str(work), str(tmp_path / 'remote.git')], str(tmp_path))
+    return str(tmp_path / 'remote.git'), git(['rev-parse', 'HEAD'], str(work))
+
+
+def get_mirror_cache(tmp_path):
+    return MirrorCache(str(tmp_path / 'mirrors'), CommandRunner(str(tmp_path / 'commands.jsonl')),
+                       log_path=str(tmp_path / 'git.log'))
+
+
+def test_materialize_offline_from_the_mirror(tmp_path, remote):
+    url, commit = remote
+    mirror_cache = get_mirror_cache(tmp_path)
+    mirror_cache.materialize(url, str(tmp_path / 'first'), [commit])
+    assert git(['rev-parse', 'HEAD'], str(tmp_path / 'first')) == commit
+    shutil.rmtree(url)
+    # the mirrored commits need no fetch, and a failed fetch falls back to the mirror
+    for dest, commits in [('second', [commit]), ('third', None)]:
+        mirror_cache.materialize(url, str(tmp_path / dest), commits)
+        assert git(['rev-parse', 'HEAD'], str(tmp_path / dest)) == commit
+        assert not os.path.exists(str(tmp_path / dest / '.git' / 'objects' / 'info' / 'alternates'))
+    assert git(['remote', 'get-url', 'upstream'], str(tmp_path / 'third')) == url
+
+
+def test_stale_partial_mirror_is_replaced(tmp_path, remote):
+    url, commit = remote
+    mirror_cache = get_mirror_cache(tmp_path)
+    os.makedirs(mirror_cache.get_mirror_path(url) + '.tmp')
+    with open(os.path.join(mirror_cache.get_mirror_path(url) + '.tmp', 'HEAD'), 'w') as f:
+        f.write('ref: refs/heads/master\n')
+    mirror_cache.materialize(url, str(tmp_path / 'checkout'), [commit])
+    assert git(['rev-parse', 'HEAD'], str(tmp_path / 'checkout')) == commit
+    assert not os.path.exists(mirror_cache.get_mirror_path(url) + '.tmp')
@@ -0,0 +1,34 @@
+import pytest
+
+from trace_information import HitInformation, HitInformationDecoder
+
+
+def test_decode():
+    values = HitInformationDecoder.decode("[[1,0,0,-1,-1,-1],[2,3,4,5,6,7]]")
+    assert list(values) == [1, 0, 0, -1, -1, -1, 2, 3, 4, 5, 6, 7]
+    assert list(map(list, HitInformationDecoder.iter_hits(values))) == [[1, 0, 0, -1, -1, -1], [2, 3, 4, 5, 6, 7]]
+
+
+def test_decode_whitespace():
+    values = HitInformationDecoder.decode(" [ [1, 0,0,\t-1,-1,-1] ,\n[2,3,4,5,6,7]\r\n] ")
+    assert list(values) == [1, 0, 0, -1, -1, -1, 2, 3, 4, 5, 6, 7]
+
+
+def test_decode_empty():
+    assert list(HitInformationDecoder.decode("[]")) == []
+    assert HitInformation.read_hit_information_string("[]", 'org.A.foo()') == []
+
+
+@pytest.mark.parametrize('hit_information', ["[[1,0,0,-1,-1,x]]", "__import__('os').system('true')",
+                                             "[[1.5,0,0,-1,-1,-1]]", "[[1,0,0,-1,-1,-1]]; 1", "[[0x1,0,0,0,0,0]]"])
+def test_decode_rejects_non_numeric(hit_information):
+    with pytest.raises(ValueError, match='unexpected'):
+        HitInformationDecoder.decode(hit_information)
+
+
+@pytest.mark.parametrize('hit_information', ["[[1,0,0,-1,-1]]", "[1,0,0,-1,-1,-1]", "[[1,0,0,-1,-1,-1]",
+                                             "[[1,0,0],[-1,-1,-1]]", "[[1,0,0,-1,-1,-1]]]", "[[1,,0,0,-1,-1,-1]]",
+                                             "[[1,0,0,-1,-1,--1]]", ""])
+def test_decode_rejects_malformed(hit_information):
+    with pytest.raises(ValueError):
+        HitInformationDecoder.decode(hit_information)
@@ -0,0 +1,44 @@
+import socket
+
+import pytest
+
+import Tracer as tracer_module
+from Tracer import Tracer
+from call_graph import JavacgEdgeReader
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_grabber_that_does_not_start_is_killed(monkeypatch):
+    # a grabber that never listens on its command port
+    processes = []
+    popen = tracer_module.Popen
+    monkeypatch.setattr(tracer_module, 'Popen', lambda args: processes.append(popen(args)) or processes[-1])
+    tracer = Tracer.__new__(Tracer)
+    tracer.command_port = str(get_free_port())
+    tracer.grabber_cmd_line = lambda: ['sleep', '60']
+    with pytest.raises(RuntimeError):
+        tracer.execute_grabber_process(timeout=0.5)
+    assert processes[0].poll() is not None
+
+
+def test_grabber_that_exits_raises():
+    tracer = Tracer.__new__(Tracer)
+    tracer.command_port = str(get_free_port())
+    tracer.grabber_cmd_line = lambda: ['sh', '-c', 'exit 2']
+    with pytest.raises(RuntimeError, match='exit code 2'):
+        tracer.execute_grabber_process(timeout=5)
+
+
+def test_bug_methods_are_named_as_in_the_call_graph():
+    reader = JavacgEdgeReader()
+    for bug, symbol in [('org.a.A$B.foo(int)', 'org.a.A$B:foo(I)V'), ('org.a.A$B.A$B(int)', 'org.a.A$B:<init>(I)V'),
+                        ('org.a.A.A(String)', 'org.a.A:<init>(Ljava/lang/String;)V'),
+                        ('org.a.A.A_init()', 'org.a.A:<clinit>()V'), ('org.a.A$B.A$B_init()', 'org.a.A$B:<clinit>()V')]:
+        assert Tracer.get_bug_method(bug) == reader.get_method_name(symbol)
+    # a method whose name only ends with _init is not an initializer
+    assert Tracer.get_bug_method('org.a.A.load_init()') == 'org.a.A.load_init'
@@ -1,5 +1,7 @@
 import re
-from functools import reduce
+from array import array
+from collections import Counter
+from itertools import chain
 
 
 class PrimitiveTypes(object):
@@ -68,6 +70,31 @@ class Signature(object):
         return args
 
 
+class HitInformationDecoder(object):
+    FIELDS = 6
+    INVALID = re.compile("[^0-9,\\-\\[\\]\\s]")
+    SEPARATORS = str.maketrans('', '', '[] \t\r\n')
+
+    @staticmethod
+    def decode(hit_information):
+        # the jcov HitInformation attribute is a list of six-int lists, decoded into a flat array of
+        # (count, previous_slot, parent, test_slot, test_parent, test_previous) rows without eval
+        invalid = HitInformationDecoder.INVALID.search(hit_information)
+        if invalid:
+            raise ValueError("unexpected {0!r} in HitInformation".format(invalid.group()))
+        body = hit_information.translate(HitInformationDecoder.SEPARATORS)
+        values = array('q', map(int, body.split(','))) if body else array('q')
+        hits, remainder = divmod(len(values), HitInformationDecoder.FIELDS)
+        if remainder or hit_information.count('[') != hits + 1 or hit_information.count(']') != hits + 1:
+            raise ValueError("malformed HitInformation {0!r}".format(hit_information[:100]))
+        return values
+
+    @staticmethod
+    def iter_hits(values):
+        fields = HitInformationDecoder.FIELDS
+        return map(lambda ind: values[ind: ind + fields], range(0, len(values), fields))
+
+
 class HitInformation(object):
     def __init__(self, method_name, lst):
         assert len(lst) == 6
@@ -82,7 +109,8 @@ class HitInformation(object):
 
     @staticmethod
     def read_hit_information_string(str, method_name):
-        return list(map(lambda lst: HitInformation(method_name, lst), eval(str)))
+        return list(map(lambda lst: HitInformation(method_name, lst),
+                        HitInformationDecoder.iter_hits(HitInformationDecoder.decode(str))))
 
 
 class TraceElement(object):
@@ -146,17 +174,33 @@ class Trace(object):
     def get_trace(self, trace_granularity='methods'):
         return list(set(map(lambda t: self.trace[t].get_trace(trace_granularity).lower().replace("java.lang.", "").replace("java.io.", "").replace("java.util.", ""), self.trace)))
 
+    def _iter_hits(self):
+        return chain.from_iterable(map(lambda element: element.hits_information, self.trace.values()))
+
     def get_execution_edges(self):
-        return set(reduce(list.__add__, list(map(lambda element: element.get_execution_edges(), self.trace.values())), []))
+        return set(map(lambda hit: hit.execution_edge, self._iter_hits()))
 
     def get_call_graph_edges(self):
-        return set(reduce(list.__add__, list(map(lambda element: element.get_call_graph_edges(), self.trace.values())), []))
+        return set(map(lambda hit: hit.call_graph_edge, self._iter_hits()))
 
     def get_execution_edges_num(self):
-        return set(reduce(list.__add__, list(map(lambda element: element.get_execution_edges_num(), self.trace.values())), []))
+        return set(chain.from_iterable(map(lambda element: element.get_execution_edges_num(), self.trace.values())))
 
     def get_call_graph_edges_num(self):
-        return set(reduce(list.__add__, list(map(lambda element: element.get_call_graph_edges_num(), self.trace.values())), []))
+        return set(chain.from_iterable(map(lambda element: element.get_call_graph_edges_num(), self.trace.values())))
+
+    def count_execution_edges(self):
+        # number of times every edge was traversed, summed over the hits
+        counter = Counter()
+        for hit in self._iter_hits():
+            counter[hit.execution_edge] += hit.count
+        return counter
+
+    def count_call_graph_edges(self):
+        counter = Counter()
+        for hit in self._iter_hits():
+            counter[hit.call_graph_edge] += hit.count
+        return counter
 
     def split_to_subtraces(self):
         # tests = list(filter(lambda x: x.method_name.split('.')[-2].endswith('Test') and x.method_name.split('.')[-1].startswith('test'), list(self.trace.values())))
@@ -0,0 +1,155 @@
+import atexit
+import json
+import os
+import sqlite3
+import time
+
+
+class TracerState(object):
+    # the state the tracers of one bug share (test results of every run, trigger tests, excluded tests, buggy functions
+    # and the call graph selections) in one sqlite database in the tracer info directory. every list is still exported
+    # to its json file for the perl framework, and a json file written by someone else is imported back. the json file
+    # stays authoritative: a list whose json file was deleted is dropped
+    SCHEMA_VERSION = 1
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS lists (name TEXT NOT NULL, position INTEGER NOT NULL, value TEXT NOT NULL, "
+        "PRIMARY KEY (name, position))",
+        "CREATE TABLE IF NOT EXISTS sources (name TEXT PRIMARY KEY, path TEXT NOT NULL, mtime_ns INTEGER, size INTEGER)",
+        "CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, trace_type TEXT NOT NULL, "
+        "created REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS test_results (run INTEGER NOT NULL REFERENCES runs(id), test_name TEXT NOT NULL, "
+        "outcome TEXT NOT NULL, time REAL, PRIMARY KEY (run, test_name))",
+        "CREATE INDEX IF NOT EXISTS test_results_outcome ON test_results (run, outcome)",
+        "CREATE INDEX IF NOT EXISTS lists_value ON lists (name, value)",
+    ]
+
+    # one connection per database of the process, the tracers of a bug are created many times
+    CONNECTIONS = {}
+
+    def __init__(self, tracer_info):
+        self.path = os.path.realpath(os.path.join(tracer_info, 'state.sqlite'))
+        TracerState.get_connection(self.path)
+
+    @property
+    def connection(self):
+        # looked up on every use, so a state closed by another tracer of the bug reopens its database
+        return TracerState.get_connection(self.path)
+
+    @staticmethod
+    def get_connection(path):
+        # connections are not shared with forked processes
+        key = (os.getpid(), path)
+        connection = TracerState.CONNECTIONS.get(key)
+        if connection is None:
+            connection = sqlite3.connect(path, timeout=60)
+            # the schema is created once per database, not on every open
+            if connection.execute("PRAGMA user_version").fetchone()[0] < TracerState.SCHEMA_VERSION:
+                with connection:
+                    for statement in TracerState.SCHEMA:
+                        connection.execute(statement)
+                    connection.execute("PRAGMA user_version = {0}".format(TracerState.SCHEMA_VERSION))
+            TracerState.CONNECTIONS[key] = connection
+        return connection
+
+    def close(self):
+        connection = TracerState.CONNECTIONS.pop((os.getpid(), self.path), None)
+        if connection is not None:
+            connection.close()
+
+    @staticmethod
+    def close_all():
+        for key in list(filter(lambda k: k[0] == os.getpid(), TracerState.CONNECTIONS)):
+            TracerState.CONNECTIONS.pop(key).close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _get_stat(json_path):
+        if not json_path or not os.path.exists(json_path):
+            return None
+        stat = os.stat(json_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _is_synced(self, name, json_path):
+        row = self.connection.execute("SELECT mtime_ns, size FROM sources WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return False
+        stat = TracerState._get_stat(json_path)
+        if stat is None and json_path:
+            # the json file was deleted, so is the list
+            with self.connection:
+                self.connection.execute("DELETE FROM lists WHERE name = ?", (name,))
+                self.connection.execute("DELETE FROM sources WHERE name = ?", (name,))
+            return False
+        return stat is None or stat == tuple(row)
+
+    def _store_list(self, name, values, json_path):
+        self.connection.execute("DELETE FROM lists WHERE name = ?", (name,))
+        self.connection.executemany("INSERT INTO lists (name, position, value) VALUES (?, ?, ?)",
+                                    map(lambda item: (name, item[0], item[1]), enumerate(values)))
+        stat = TracerState._get_stat(json_path) or (None, None)
+        self.connection.execute("INSERT OR REPLACE INTO sources (name, path, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                                (name, json_path or '', stat[0], stat[1]))
+
+    def has_list(self, name, json_path=None):
+        return self._is_synced(name, json_path) or TracerState._get_stat(json_path) is not None
+
+    def get_list(self, name, json_path=None):
+        # the stored list, imported from json_path when it was never stored or the json changed since, None if missing
+        if not self._is_synced(name, json_path):
+            if TracerState._get_stat(json_path) is None:
+                return None
+            with open(json_path) as f:
+                values = json.loads(f.read())
+            with self.connection:
+                self._store_list(name, values, json_path)
+            return values
+        return list(map(lambda row: row[0], self.connection.execute(
+            "SELECT value FROM lists WHERE name = ? ORDER BY position", (name,))))
+
+    def set_list(self, name, values, json_path=None):
+        values = list(values)
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(values, f)
+        with self.connection:
+            self._store_list(name, values, json_path)
+
+    def contains(self, name, value):
+        return self.connection.execute("SELECT 1 FROM lists WHERE name = ? AND value = ? LIMIT 1",
+                                       (name, value)).fetchone() is not None
+
+    def add_test_results(self, trace_type, test_results):
+        # stores the results of one tests run in one transaction and returns the run id
+        with self.connection:
+            run = self.connection.execute("INSERT INTO runs (trace_type, created) VALUES (?, ?)",
+                                          (trace_type, time.time())).lastrowid
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO test_results (run, test_name, outcome, time) VALUES (?, ?, ?, ?)",
+                map(lambda test: (run, test.full_name, test.outcome, test.time), test_results))
+        return run
+
+    def get_last_run(self, trace_type=None):
+        if trace_type is None:
+            row = self.connection.execute("SELECT MAX(id) FROM runs").fetchone()
+        else:
+            row = self.connection.execute("SELECT MAX(id) FROM runs WHERE trace_type = ?", (trace_type,)).fetchone()
+        return row[0]
+
+    def get_test_results(self, run=None, outcomes=None):
+        # (test name, outcome, time) of a run, the last one by default, optionally only with the given outcomes
+        run = run or self.get_last_run()
+        if outcomes is None:
+            rows = self.connection.execute("SELECT test_name, outcome, time FROM test_results WHERE run = ?", (run,))
+        else:
+            rows = self.connection.execute(
+                "SELECT test_name, outcome, time FROM test_results WHERE run = ? AND outcome IN ({0})".format(
+                    ','.join('?' * len(outcomes))), [run] + list(outcomes))
+        return list(rows)
+
+
+atexit.register(TracerState.close_all)
@@ -1,15 +1,19 @@
-import time
+from contextlib import contextmanager
 from datetime import datetime
 from functools import reduce
-from subprocess import Popen, PIPE, run
-from subprocess import run
+import fcntl
 import os
+import shlex
 import sys
 
 import git
 import pandas as pd
 from d4jchanges import SourceFixer
 from issues_extractor import extract_issues
+from mirror_cache import MirrorCache
+from command_runner import CommandRunner
+from compile_repair import CompileRepair
+from stage_runner import Stage, StageRunner
 from Tracer import Tracer
 
 projects = {'distributedlog': ('https://github.com/apache/distributedlog', 'DL'),
@@ -347,17 +351,15 @@ def layout(repo_path, commit_id):
     #     f.writelines(map(lambda x: x + '\n', [commond_java, commond_tests]))
 
 
-def diff_on_layouts(repo_path, commit_a, commit_b, src_patch, test_patch):
+def diff_on_layouts(commands, repo_path, commit_a, commit_b, src_patch, test_patch):
     java_a, test_a = layout(repo_path, commit_a)
     java_b, test_b = layout(repo_path, commit_b)
     assert java_a == java_b
     assert test_a == test_b
-    diff_src = f"git diff --no-ext-diff --binary {commit_a} {commit_b} {java_a}".split()
-    diff_test = f"git diff --no-ext-diff --binary {commit_a} {commit_b} {test_a}".split()
-    with open(src_patch, 'w') as out:
-        run(diff_src, cwd=repo_path, stdout=out)
-    with open(test_patch, 'w') as out:
-        run(diff_test, cwd=repo_path, stdout=out)
+    # only the diff goes to the patch, the errors of git stay on stderr
+    for path, patch in [(java_a, src_patch), (test_a, test_patch)]:
+        commands.run('get_diffs',
+                     f"git diff --no-ext-diff --binary {commit_a} {commit_b} {path} > {shlex.quote(patch)}", repo_path)
 
     # TODO: check patches are not empty
 
@@ -393,31 +395,14 @@ def fix_build(dir):
         f.writelines(lines)
 
 
-def collect_files_with_compilations_errors(file_name, proj_dir):
-    files = []
-    with open(file_name) as f:
-        for l in f.readlines():
-            if 'error' in l and '.java' in l:
-                if proj_dir in l:
-                    c = proj_dir + l.split(proj_dir)[1].split('.java')[0] + '.java'
-                    files.append(c)
-    return files
-
-
-def fix_compilation_errors(files):
-    for c in set(files):
-        if 'test' in c.lower():
-            try:
-                print(c)
-                os.remove(c)
-            except Exception as e:
-                print(e)
+TRACE_STAGES = ['compile', 'observe_fixed_tests', 'exclude_tests', 'apply_patch', 'get_buggy_functions',
+                'create_call_graph', 'sanity_trace', 'full_trace']
 
 
 class Reproducer:
     ACTIVE_BUGS = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "active-bugs.csv")
 
-    def __init__(self, project_name, working_dir, ind):
+    def __init__(self, project_name, working_dir, ind, repo_path=None, logs_dir=None):
 
         self.jira_key = projects[project_name][1]
         self.project_dir = os.path.join(os.path.abspath(working_dir), 'framework', 'projects', self.jira_key.title())
@@ -425,15 +410,29 @@ class Reproducer:
         self.url = projects[project_name][0]
         self.work_dir = os.path.abspath(working_dir)
         self.repo_dir = os.path.abspath(os.path.join('project_repos'))
-        self.repo_path = os.path.join(self.repo_dir, project_name)
-        self.out_jar_path = os.path.join(self.repo_dir, "jar_path.jar")
+        self.repo_path = repo_path or os.path.join(self.repo_dir, project_name)
+        self.mirrors_dir = os.environ.get('D4J_MIRRORS_DIR', os.path.join(self.repo_dir, 'mirrors'))
+        # the number of forked test runs of the full trace, 1 runs the whole suite in one jvm
+        self.test_forks = int(os.environ.get('D4J_TEST_FORKS', '1'))
+        # the granularity of the full trace test selection, class or method
+        self.test_selection = os.environ.get('D4J_TEST_SELECTION', 'class')
+        self.logs_dir = logs_dir or self.work_dir
         self.patch_dir = os.path.join(self.project_dir, 'patches')
+        self.commands = CommandRunner(os.path.join(self.logs_dir, f"commands_{self.jira_key}_{self.ind}.jsonl"),
+                                      os.path.join(self.logs_dir, f"commands_{self.jira_key}_{self.ind}.trace.json"))
 
     def create_project(self):
-        for d in [self.project_dir, self.patch_dir, self.work_dir]:
+        for d in [self.project_dir, self.patch_dir, self.work_dir, self.logs_dir]:
             os.makedirs(d, exist_ok=True)
         os.makedirs(self.repo_dir, exist_ok=True)
-        os.system(f"git clone {self.url} {self.repo_path}")
+        MirrorCache(self.mirrors_dir, self.commands, log_path=self.get_log_path('create_project')).materialize(
+            self.url, self.repo_path, self.get_known_commits())
+
+    def get_known_commits(self):
+        try:
+            return self.get_commits()
+        except Exception:
+            return None
 
     def extract_issues(self):
         extract_issues(self.repo_path, self.jira_key, Reproducer.ACTIVE_BUGS)
@@ -441,22 +440,34 @@ class Reproducer:
     def init_version(self):
         repo = git.Repo(self.repo_path)
         fix, buggy = self.get_commits()
-        repo.git.checkout(fix, force=True)
+        self.commands.run('init_version', f"git checkout -f {fix}", repo.working_dir,
+                          self.get_log_path('init_version'))
         if 'pom.xml' in os.listdir(repo.working_dir):
             sf = SourceFixer(repo.working_dir)
             sf.remove_compiler_version()
-            os.system(
-                f"cd {self.repo_path} && mvn ant:ant -Doverwrite=true 2>&1 -Dhttps.protocols=TLSv1.2 -Dmaven.compile.source=1.8 -Dmaven.compile.target=1.8")
-            fix_mvn_compiler_dir(repo.working_dir)
-            # os.system(
-            #     f"cd {self.repo_path} && sed \'s\/https:\\/\\/oss\\.sonatype\\.org\\/content\\/repositories\\/snapshots\\//http:\\/\\/central\\.maven\\.org\\/maven2\\/\/g\' maven-build.xml > temp && mv temp maven-build.xml")
-            os.system(
-                f"cd {self.repo_path} && ant -Dmaven.repo.local=\"{os.path.join(self.project_dir, 'lib')}\" get-deps")
+            with self.maven_lock():
+                self.commands.run('init_version', "mvn ant:ant -Doverwrite=true -Dhttps.protocols=TLSv1.2 -Dmaven.compile.source=1.8 -Dmaven.compile.target=1.8", self.repo_path)
+                fix_mvn_compiler_dir(repo.working_dir)
+                # os.system(
+                #     f"cd {self.repo_path} && sed \'s\/https:\\/\\/oss\\.sonatype\\.org\\/content\\/repositories\\/snapshots\\//http:\\/\\/central\\.maven\\.org\\/maven2\\/\/g\' maven-build.xml > temp && mv temp maven-build.xml")
+                self.commands.run('init_version', f"ant -Dmaven.repo.local=\"{os.path.join(self.project_dir, 'lib')}\" get-deps", self.repo_path)
         fix_build(repo.working_dir)
 
+    @contextmanager
+    def maven_lock(self):
+        # the bugs of a project mined at once share its maven repository at <project_dir>/lib, so only one of them
+        # resolves the dependencies at a time
+        os.makedirs(self.project_dir, exist_ok=True)
+        with open(os.path.join(self.project_dir, 'lib.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
     def get_diffs(self):
         commit_a, commit_b = self.get_commits()
-        diff_on_layouts(self.repo_path, commit_a, commit_b,
+        diff_on_layouts(self.commands, self.repo_path, commit_a, commit_b,
                         os.path.join(self.patch_dir, self.ind + '.src.patch'),
                         os.path.join(self.patch_dir, self.ind + '.test.patch'))
 
@@ -466,74 +477,156 @@ class Reproducer:
             0].tolist()
         return fix, buggy
 
-    def collect_and_trace(self):
-        # run fixed version and collect failed tests
+    def get_manifest_path(self):
+        return os.path.join(self.logs_dir, f"stages_{self.jira_key}_{self.ind}.json")
+
+    def get_tracer(self, trace_type='full', test_selection=None):
+        return Tracer(os.path.abspath(self.repo_path), trace_type, self.ind, test_selection)
+
+    def get_tracer_paths(self, trace_type, *names):
+        # the paths of the tracer files, the tracer is created only when a stage runs, after create_project
+        return lambda: list(map(lambda name: getattr(self.get_tracer(trace_type), name), names))
+
+    def get_commits_params(self):
+        return {'commits': self.get_commits()}
+
+    def get_checkout_id(self):
+        # the path of the checkout and the inode of its .git, a worktree recreated at the same path is a new checkout
+        git_path = os.path.join(self.repo_path, '.git')
+        return [os.path.realpath(self.repo_path), os.stat(git_path).st_ino if os.path.exists(git_path) else None]
+
+    def get_checkout_params(self, params=None):
+        # the params of a stage that runs in the checkout, so its key changes when the checkout is replaced
+        return lambda: dict(params() if callable(params) else params or {}, checkout=self.get_checkout_id())
+
+    def reset_stages(self):
+        # forgets the finished stages of the bug, for a new checkout
+        if os.path.exists(self.get_manifest_path()):
+            os.remove(self.get_manifest_path())
+
+    def get_log_path(self, stage):
+        return os.path.join(self.logs_dir, f"{stage}_{self.jira_key}_{self.ind}.log")
+
+    def get_compile_repair_path(self, stage):
+        return os.path.join(self.logs_dir, f"compile_repair_{self.jira_key}_{self.ind}_{stage}.json")
+
+    def get_stages(self):
+        # the mining pipeline of the bug, the stages of collect_and_trace start at compile. every stage declares
+        # outputs that only it writes, so a stage is done only after it ran, and the stages that run in the checkout
+        # depend on it
+        checkout = self.get_checkout_params()
+        src_patch = os.path.join(self.patch_dir, self.ind + '.src.patch')
+        call_graph_paths = self.get_tracer_paths('full', 'call_graph_tests_path', 'call_graph_nodes_path')
+        return [Stage('create_project', self.create_project, params={'url': self.url}, outputs=[self.repo_path]),
+                Stage('extract_issues', self.extract_issues, params={'jira_key': self.jira_key},
+                      outputs=[Reproducer.ACTIVE_BUGS]),
+                Stage('get_diffs', self.get_diffs, params=self.get_checkout_params(self.get_commits_params),
+                      outputs=[src_patch, os.path.join(self.patch_dir, self.ind + '.test.patch')]),
+                Stage('init_version', self.init_version, params=self.get_checkout_params(self.get_commits_params),
+                      outputs=[self.get_log_path('init_version')]),
+                Stage('compile', self.compile, params=checkout, outputs=[self.get_compile_repair_path('compile')]),
+                Stage('observe_fixed_tests', self.observe_fixed_tests, params=checkout,
+                      outputs=[self.get_log_path('observe_fixed_tests')]),
+                Stage('exclude_tests', self.exclude_tests, params=checkout,
+                      outputs=[self.get_compile_repair_path('exclude_tests'), self.get_log_path('exclude_tests')]),
+                Stage('apply_patch', self.apply_patch, params=checkout, inputs=[src_patch],
+                      outputs=[self.get_compile_repair_path('apply_patch'), self.get_log_path('apply_patch')]),
+                Stage('get_buggy_functions', self.get_buggy_functions, params=checkout, inputs=[src_patch],
+                      outputs=self.get_tracer_paths('full', 'bugs_file')),
+                Stage('create_call_graph', self.create_call_graph, params=checkout,
+                      inputs=self.get_tracer_paths('full', 'bugs_file', 'trigger_tests_path'),
+                      outputs=self.get_tracer_paths('full', 'call_graph_path')),
+                Stage('sanity_trace', self.sanity_trace, params=checkout, inputs=call_graph_paths,
+                      outputs=self.get_tracer_paths('sanity', 'path_to_result_file')),
+                Stage('full_trace', self.full_trace, inputs=call_graph_paths,
+                      params=self.get_checkout_params({'forks': self.test_forks,
+                                                       'test_selection': self.test_selection}),
+                      outputs=self.get_tracer_paths('full', 'path_to_result_file'))]
+
+    def run_stages(self, names=None, force=False):
+        StageRunner(self.get_manifest_path(), self.commands).run(self.get_stages(), names, force)
+
+    def compile(self):
         repo = git.Repo(self.repo_path)
-        # repo.git.checkout(fix, force=True)
-        # todo the post checkout
+        self.commands.run('compile', "ant -q  -Dbuild.compiler=javac1.8  compile", repo.working_dir)
+        self.repair_test_compilation('compile')
+
+    def repair_test_compilation(self, stage):
+        # compiles the tests, removing the tests that do not compile, see CompileRepair
+        log_path = os.path.join(self.logs_dir, 'compile_tests_trigger_log.log')
+        return CompileRepair(
+            self.repo_path, lambda: self.commands.run(stage, "ant -q  -Dbuild.compiler=javac1.8  compile-tests",
+                                                      self.repo_path, log_path), log_path,
+            self.get_compile_repair_path(stage)).run()
+
+    def observe_fixed_tests(self):
         # run fixed version and collect failed tests
-        os.system(f"cd {repo.working_dir} && ant -q  -Dbuild.compiler=javac1.8  compile 2>&1")
-        os.system(
-            f"cd {repo.working_dir} && ant -q  -Dbuild.compiler=javac1.8  compile-tests 2>&1 > {os.path.join(self.work_dir, 'compile_tests_trigger_log.log')}")
-
-        fix_compilation_errors(collect_files_with_compilations_errors(os.path.join(self.work_dir, 'compile_tests_trigger_log.log'),
-                                                                      repo.working_dir))
-        os.system(
-            f"cd {repo.working_dir} && ant -q  -Dbuild.compiler=javac1.8  compile-tests 2>&1 > {os.path.join(self.work_dir, 'compile_tests_trigger_log.log')}")
-
+        repo = git.Repo(self.repo_path)
         Tracer(os.path.abspath(repo.working_dir), 'full', self.ind).set_junit_props()
 
-        os.system(
-            f"cd {repo.working_dir} && ant -q  -keep-going test 2>&1 > {os.path.join(self.work_dir, 'failing_tests_logger.log')}")
+        self.commands.run('observe_fixed_tests', "ant -q  -keep-going test", repo.working_dir,
+                          self.get_log_path('observe_fixed_tests'))
 
         # collect failing_test
         Tracer(os.path.abspath(repo.working_dir), 'full', self.ind).observe_tests()
 
+    def exclude_tests(self):
+        repo = git.Repo(self.repo_path)
         Tracer(os.path.abspath(repo.working_dir), 'full', self.ind).exclude_tests()
-        os.system(
-            f"cd {repo.working_dir} && ant -q  -Dbuild.compiler=javac1.8  compile-tests 2>&1 > {os.path.join(self.work_dir, 'compile_tests_trigger_log.log')}")
-        os.system(
-            f"cd {repo.working_dir} && ant -q -Dbuild.compiler=javac1.8  -keep-going test  2>&1 > {os.path.join(self.work_dir, 'failing_tests_logger.log')}")
+        self.repair_test_compilation('exclude_tests')
+        self.commands.run('exclude_tests', "ant -q -Dbuild.compiler=javac1.8  -keep-going test", repo.working_dir,
+                          self.get_log_path('exclude_tests'))
 
         # make sure there are no failing tests
 
-        # apply patch
-
-        os.system(
-            f"cd {repo.working_dir} && git apply  {os.path.join(self.patch_dir, self.ind + '.src.patch')} --whitespace=nowarn")
-        os.system(
-            f"cd {repo.working_dir} && ant -q  -Dbuild.compiler=javac1.8  compile-tests 2>&1 > {os.path.join(self.work_dir, 'compile_tests_trigger_log.log')}")
-        os.system(
-            f"cd {repo.working_dir} && ant -q -Dbuild.compiler=javac1.8  -keep-going test 2>&1 > {os.path.join(self.work_dir, 'failing_tests_logger.log')}")
+    def apply_patch(self):
+        repo = git.Repo(self.repo_path)
+        src_patch = os.path.join(self.patch_dir, self.ind + '.src.patch')
+        # a resumed stage may find the patch already applied
+        if self.commands.run('apply_patch', f"git apply -R --check {src_patch} 2>/dev/null", repo.working_dir) != 0:
+            self.commands.run('apply_patch', f"git apply  {src_patch} --whitespace=nowarn", repo.working_dir)
+        self.repair_test_compilation('apply_patch')
+        self.commands.run('apply_patch', "ant -q -Dbuild.compiler=javac1.8  -keep-going test", repo.working_dir,
+                          self.get_log_path('apply_patch'))
         # make sure there are failing tests
         Tracer(os.path.abspath(repo.working_dir), 'full', self.ind).observe_tests()
 
-        Tracer(os.path.abspath(repo.working_dir), 'full', self.ind).get_buggy_functions()
-        os.system(f"jar cvf {self.out_jar_path} {repo.working_dir} 2>&1")
-        Tracer(os.path.abspath(repo.working_dir), 'full', self.ind).create_call_graph(self.out_jar_path)
+    def get_buggy_functions(self):
+        Tracer(os.path.abspath(self.repo_path), 'full', self.ind).get_buggy_functions(
+            os.path.join(self.patch_dir, self.ind + '.src.patch'))
+
+    def create_call_graph(self):
+        Tracer(os.path.abspath(self.repo_path), 'full', self.ind).create_call_graph()
 
-        # sanity trace
-        Tracer(os.path.abspath(repo.working_dir), 'sanity', self.ind).triple()
-        time.sleep(20)
-        os.system(f"cd {repo.working_dir} && ant -q  -Dbuild.compiler=javac1.8  -keep-going test 2>&1")
-        t = Tracer(os.path.abspath(repo.working_dir), 'sanity', self.ind)
-        t.stop_grabber()
+    def sanity_trace(self):
+        repo = git.Repo(self.repo_path)
+        with Tracer(os.path.abspath(repo.working_dir), 'sanity', self.ind).grabber_session() as t:
+            self.commands.run('sanity_trace', "ant -q  -Dbuild.compiler=javac1.8  -keep-going test 2>&1", repo.working_dir)
+            t.stop_grabber()
 
         # check if sanity file exists
         # if not os.path.exists(t.matrix):
         #     return
-        Tracer(os.path.abspath(repo.working_dir), 'full', self.ind).triple()
-        time.sleep(20)
-        os.system(
-            f"cd {repo.working_dir} && ant -q  -Dbuild.compiler=javac1.8  -keep-going test 2>&1")
-        Tracer(os.path.abspath(repo.working_dir), 'full', self.ind).stop_grabber()
+
+    def full_trace(self):
+        repo = git.Repo(self.repo_path)
+        if self.test_forks > 1:
+            with Tracer(os.path.abspath(repo.working_dir), 'full', self.ind, self.test_selection).forked_grabber_session(
+                    self.test_forks) as t:
+                t.run_tests(self.commands, 'full_trace', "ant -q -Dbuild.compiler=javac1.8 -keep-going test",
+                            os.path.join(self.logs_dir, 'full_trace.log'))
+                t.stop_grabber()
+        else:
+            with Tracer(os.path.abspath(repo.working_dir), 'full', self.ind, self.test_selection).grabber_session() as t:
+                self.commands.run('full_trace', "ant -q  -Dbuild.compiler=javac1.8  -keep-going test 2>&1",
+                                  repo.working_dir)
+                t.stop_grabber()
+
+    def collect_and_trace(self):
+        self.run_stages(TRACE_STAGES)
 
     def do_all(self):
-        self.create_project()
-        self.extract_issues()
-        self.get_diffs()
-        self.init_version()
-        self.collect_and_trace()
+        self.run_stages()
 
 
 if __name__ == '__main__':